@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Synthetic -texpos.ndjson generator
+
+Writes NDJSON records shaped like the ones TeX-lib/geom-marks.tex emits
+(id, role, xsp/ysp, pw/ph, page, page_source, cwsp/twsp, col, colsep,
+twocolumn) for a two-column A4 article, so the post-processing scripts can
+be benchmarked without a LaTeX install. The stream includes paragraphs
+that break across columns, deferred and multi-page floats, duplicate
+records and the occasional page-counter fallback. Matching blank page PNGs
+can be written for the draw_* renderers.
+
+Usage:
+  python3 generate_texpos.py bench-texpos.ndjson --records 1M
+  python3 generate_texpos.py bench-texpos.ndjson --records 10k --images bench-pages --dpi 72
+"""
+
+import argparse
+import io
+import random
+from pathlib import Path
+
+SP_PER_PT = 65536
+
+# A4 as written by \the\paperwidth / \the\paperheight
+PAGE_WIDTH = "597.50787pt"
+PAGE_HEIGHT = "845.04684pt"
+PAGE_WIDTH_PT = 597.50787
+PAGE_HEIGHT_PT = 845.04684
+
+# Two-column text block (pt, TeX origin at the bottom-left of the page)
+LEFT_MARGIN_PT = 54.0
+COLUMN_WIDTH_PT = 236.0
+COLUMN_SEP_PT = 17.5
+TEXT_WIDTH_PT = 2 * COLUMN_WIDTH_PT + COLUMN_SEP_PT
+TEXT_TOP_PT = 780.0
+TEXT_BOTTOM_PT = 66.0
+
+# Share of elements by kind, and rates of the awkward cases
+KIND_WEIGHTS = (("P", 0.86), ("FIG", 0.09), ("TABLE", 0.05))
+ID_PREFIXES = {"P": "sec-p", "FIG": "fig", "TABLE": "tab"}
+SPANNING_FLOAT_RATE = 0.25
+MULTI_PAGE_FLOAT_RATE = 0.03
+DEFERRED_FLOAT_RATE = 0.3
+DUPLICATE_RATE = 0.01
+COUNTER_SOURCE_RATE = 0.02
+
+# \geomemit writes ' {...} ' (the spaces around the object included)
+RECORD_TEMPLATE = (
+    ' {{"id":"{id}","role":"{role}","xsp":"{x}","ysp":"{y}","pw":"' + PAGE_WIDTH +
+    '","ph":"' + PAGE_HEIGHT + '","page":{page},"page_source":"{source}",'
+    '"cwsp":{cw},"twsp":{tw},"col":{col},"colsep":{sep},"twocolumn":1}} \n'
+)
+
+def parse_count(text):
+    """Parse counts such as 1000, 10k or 2.5M"""
+    text = str(text).strip().lower()
+    scale = {"k": 1_000, "m": 1_000_000}.get(text[-1:], 1)
+    if scale != 1:
+        text = text[:-1]
+    return int(float(text) * scale)
+
+def sp(pt):
+    return int(round(pt * SP_PER_PT))
+
+class LayoutState:
+    """Current typesetting position: page, column and remaining height"""
+
+    def __init__(self):
+        self.page = 1
+        self.col = 0
+        self.y = TEXT_TOP_PT
+
+    def column_x(self, col=None):
+        col = self.col if col is None else col
+        return LEFT_MARGIN_PT + col * (COLUMN_WIDTH_PT + COLUMN_SEP_PT)
+
+    def advance_column(self):
+        if self.col == 0:
+            self.col = 1
+        else:
+            self.col = 0
+            self.page += 1
+        self.y = TEXT_TOP_PT
+
+def generate_elements(rng):
+    """Yield (id, kind, start, end) tuples; start/end are (page, col, x_pt, y_pt)"""
+    state = LayoutState()
+    kinds = [kind for kind, _ in KIND_WEIGHTS]
+    weights = [weight for _, weight in KIND_WEIGHTS]
+    counters = {kind: 0 for kind in kinds}
+
+    while True:
+        kind = rng.choices(kinds, weights)[0]
+        counters[kind] += 1
+        element_id = f"{ID_PREFIXES[kind]}-{counters[kind]:03d}"
+
+        if kind == "P":
+            height = rng.uniform(14.0, 140.0)
+            start = (state.page, state.col, state.column_x(), state.y)
+            if state.y - height >= TEXT_BOTTOM_PT:
+                state.y -= height
+            else:
+                # Paragraph breaks into the next column (or page)
+                remainder = height - (state.y - TEXT_BOTTOM_PT)
+                state.advance_column()
+                state.y = max(TEXT_TOP_PT - remainder, TEXT_BOTTOM_PT)
+            end_x = state.column_x() + rng.uniform(0.0, COLUMN_WIDTH_PT)
+            # Most paragraph marks sit at the left edge of the line
+            if rng.random() < 0.5:
+                end_x = state.column_x()
+            end = (state.page, state.col, end_x, state.y)
+            yield element_id, kind, start, end
+            state.y -= 6.0
+            if state.y < TEXT_BOTTOM_PT + 14.0:
+                state.advance_column()
+            continue
+
+        # Floats go to the top of this or the next page
+        page = state.page + (1 if rng.random() < DEFERRED_FLOAT_RATE else 0)
+        spanning = rng.random() < SPANNING_FLOAT_RATE
+        col = 0 if spanning else rng.choice((0, 1))
+        width = TEXT_WIDTH_PT if spanning else COLUMN_WIDTH_PT
+        height = rng.uniform(120.0, 420.0)
+        x = state.column_x(col)
+        top = TEXT_TOP_PT - rng.uniform(0.0, 20.0)
+        start = (page, col, x, top)
+        if rng.random() < MULTI_PAGE_FLOAT_RATE:
+            end = (page + 1, col, x + width, TEXT_TOP_PT - height / 2)
+        else:
+            end = (page, col, x + width if spanning else x, top - height)
+        yield element_id, kind, start, end
+
+def format_record(element_id, role, position, page_source):
+    page, col, x_pt, y_pt = position
+    return RECORD_TEMPLATE.format(
+        id=element_id, role=role, x=sp(x_pt), y=sp(y_pt), page=page,
+        source=page_source, cw=sp(COLUMN_WIDTH_PT), tw=sp(TEXT_WIDTH_PT),
+        col=col, sep=sp(COLUMN_SEP_PT)
+    )
+
+def generate(output_file, records, seed=0):
+    """Write about ``records`` NDJSON lines; returns {'records': n, 'pages': n}"""
+    rng = random.Random(seed)
+    written = 0
+    last_page = 1
+
+    with open(output_file, "w", buffering=1 << 20) as f:
+        for element_id, kind, start, end in generate_elements(rng):
+            if written >= records:
+                break
+            source = "counter" if rng.random() < COUNTER_SOURCE_RATE else "zref"
+            start_line = format_record(element_id, f"{kind}-start", start, source)
+            f.write(start_line)
+            written += 1
+            if rng.random() < DUPLICATE_RATE:
+                f.write(start_line)
+                written += 1
+            f.write(format_record(element_id, f"{kind}-end", end, source))
+            written += 1
+            last_page = max(last_page, start[0], end[0])
+
+    return {"records": written, "pages": last_page}
+
+def write_page_images(prefix, pages, dpi=72):
+    """Write blank page PNGs <prefix>-<page>.png sized for the given DPI"""
+    from PIL import Image
+
+    size = (round(PAGE_WIDTH_PT * dpi / 72.0), round(PAGE_HEIGHT_PT * dpi / 72.0))
+    buffer = io.BytesIO()
+    Image.new("RGB", size, "white").save(buffer, format="PNG")
+    data = buffer.getvalue()
+
+    prefix = Path(prefix)
+    prefix.parent.mkdir(parents=True, exist_ok=True)
+    for page in range(1, pages + 1):
+        Path(f"{prefix}-{page}.png").write_bytes(data)
+    return size
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic -texpos.ndjson files (and page images)")
+    parser.add_argument("output", type=Path, help="NDJSON file to write")
+    parser.add_argument("--records", default="10k", help="Approximate record count, e.g. 1k, 250k, 10M (default: 10k)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+    parser.add_argument("--images", default=None, help="Also write blank page PNGs with this prefix")
+    parser.add_argument("--dpi", type=float, default=72, help="Resolution of the page PNGs (default: 72)")
+
+    args = parser.parse_args()
+
+    stats = generate(args.output, parse_count(args.records), args.seed)
+    print(f"Wrote {stats['records']} records on {stats['pages']} pages to {args.output}")
+
+    if args.images:
+        size = write_page_images(args.images, stats["pages"], args.dpi)
+        print(f"Wrote {stats['pages']} page images ({size[0]}x{size[1]}) as {args.images}-<page>.png")
+
+if __name__ == "__main__":
+    main()
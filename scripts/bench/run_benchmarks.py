@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""
+Benchmark runner for the coordinate post-processing scripts
+
+Generates synthetic -texpos.ndjson files (see generate_texpos.py) at one or
+more sizes and times each tool on them: throughput, per-item latency and the
+peak RSS of the process running it. Every measurement runs in a fresh child
+process so import costs and memory from one tool never leak into the next.
+Results can be saved as a baseline and later runs compared against it.
+
+Tools:
+  convert       convert_ndjson_to_marked_boxes (JSON + .mbx), per record
+  validate      validate_page_numbers.validate_file, per record
+  index         box_index build from the marked-boxes JSON, per box
+  index-query   box_index point queries, per query
+  draw-boxes    draw_bounding_boxes (full page renders), per page
+  draw-marks    draw_ndjson_marks (full page renders), per page
+  draw-overlay  draw_annotations --overlay (boxes + marks), per page
+
+Usage:
+  python3 run_benchmarks.py --records 1k,100k,1M --save-baseline baseline.json
+  python3 run_benchmarks.py --records 1k,100k,1M --baseline baseline.json
+  python3 run_benchmarks.py --records 10M --tools convert,validate --repeat 1
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+TOOLS_DIR = BENCH_DIR.parent / "external"
+sys.path.insert(0, str(BENCH_DIR))
+sys.path.insert(0, str(TOOLS_DIR))
+
+from generate_texpos import generate, parse_count, write_page_images
+
+TOOLS = ["convert", "validate", "index", "index-query", "draw-boxes", "draw-marks", "draw-overlay"]
+DRAW_TOOLS = {"draw-boxes", "draw-marks", "draw-overlay"}
+# Tools that read the marked-boxes JSON written by convert
+NEEDS_BOXES = {"index", "index-query"}
+
+DEFAULT_TOLERANCE = 0.25
+# Slowdowns smaller than this are timer noise on tiny inputs
+DEFAULT_MIN_DELTA_S = 0.05
+DEFAULT_MAX_IMAGE_PAGES = 200
+DEFAULT_QUERIES = 10000
+
+def format_count(n):
+    for scale, suffix in ((1_000_000, "M"), (1_000, "k")):
+        if n >= scale and n % scale == 0:
+            return f"{n // scale}{suffix}"
+    return str(n)
+
+def boxes_json_for(workdir):
+    return Path(workdir) / "bench-marked-boxes.json"
+
+# ---------------------------------------------------------------------------
+# Child side: run one tool and report what was processed
+
+def run_tool(tool, ndjson, workdir, images=None, workers=None, queries=DEFAULT_QUERIES, seed=0):
+    """Run one tool in this process; returns {'items', 'unit', 'seconds'}"""
+    workdir = Path(workdir)
+
+    if tool == "convert":
+        from convert_ndjson_to_marked_boxes import convert_ndjson_to_marked_boxes
+        records = sum(1 for _ in open(ndjson, "rb"))
+        start = time.perf_counter()
+        convert_ndjson_to_marked_boxes(ndjson, boxes_json_for(workdir))
+        return {"items": records, "unit": "record", "seconds": time.perf_counter() - start}
+
+    if tool == "validate":
+        from validate_page_numbers import validate_file
+        start = time.perf_counter()
+        report = validate_file(ndjson)
+        return {"items": report["total_records"], "unit": "record", "seconds": time.perf_counter() - start}
+
+    if tool == "index":
+        from box_index import build_index_file
+        start = time.perf_counter()
+        _, index = build_index_file(boxes_json_for(workdir))
+        return {"items": len(index), "unit": "box", "seconds": time.perf_counter() - start}
+
+    if tool == "index-query":
+        from box_index import open_index
+        index = open_index(boxes_json_for(workdir))
+        pages = index.pages
+        rng = random.Random(seed)
+        points = [(rng.choice(pages), rng.uniform(0, 600), rng.uniform(0, 850)) for _ in range(queries)]
+        start = time.perf_counter()
+        index.query_points(points)
+        return {"items": len(points), "unit": "query", "seconds": time.perf_counter() - start}
+
+    if tool in DRAW_TOOLS:
+        from draw_annotations import render_annotations
+        options = {
+            "draw-boxes": {"marks": False, "suffix": "boxes"},
+            "draw-marks": {"boxes": False, "suffix": "marks"},
+            "draw-overlay": {"overlay": True},
+        }[tool]
+        output_dir = workdir / tool
+        start = time.perf_counter()
+        pages = render_annotations(ndjson, images, output_dir, workers=workers, **options)
+        seconds = time.perf_counter() - start
+        shutil.rmtree(output_dir, ignore_errors=True)
+        return {"items": pages, "unit": "page", "seconds": seconds}
+
+    raise ValueError(f"Unknown tool: {tool}")
+
+# ---------------------------------------------------------------------------
+# Parent side: spawn, measure, summarize
+
+def measure(tool, ndjson, workdir, images=None, workers=None, queries=DEFAULT_QUERIES):
+    """Run a tool in a child process; adds wall time of the child and its peak RSS"""
+    workdir = Path(workdir)
+    result_file = workdir / f"result-{tool}.json"
+    log_file = workdir / f"{tool}.log"
+    command = [sys.executable, str(Path(__file__).resolve()), "--run-tool", tool,
+               "--ndjson", str(ndjson), "--workdir", str(workdir), "--result", str(result_file),
+               "--queries", str(queries)]
+    if images:
+        command += ["--images", str(images)]
+    if workers:
+        command += ["--workers", str(workers)]
+
+    with open(log_file, "w") as log:
+        start = time.perf_counter()
+        process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=log)
+        # wait4 gives the child's own rusage (its reaped workers included)
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        process_seconds = time.perf_counter() - start
+
+    if process.returncode != 0 or not result_file.exists():
+        tail = log_file.read_text(errors="replace").strip().splitlines()[-5:]
+        raise RuntimeError(f"{tool} exited with {process.returncode}: " + " | ".join(tail))
+
+    result = json.loads(result_file.read_text())
+    result_file.unlink()
+    result["process_seconds"] = process_seconds
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    result["peak_rss_kb"] = usage.ru_maxrss // 1024 if sys.platform == "darwin" else usage.ru_maxrss
+    return result
+
+def summarize(runs):
+    """Collapse repeated runs of one tool into a single result"""
+    seconds = [run["seconds"] for run in runs]
+    best = min(seconds)
+    items = runs[0]["items"]
+    return {
+        "items": items,
+        "unit": runs[0]["unit"],
+        "runs": len(runs),
+        "seconds": round(statistics.median(seconds), 6),
+        "best_seconds": round(best, 6),
+        "process_seconds": round(statistics.median(run["process_seconds"] for run in runs), 6),
+        "throughput": round(items / best, 2) if best > 0 else None,
+        "latency_us": round(best / items * 1e6, 3) if items else None,
+        "peak_rss_kb": max(run["peak_rss_kb"] for run in runs),
+    }
+
+def run_benchmarks(sizes, tools, workdir, repeat=3, seed=0, workers=None, dpi=72,
+                   max_image_pages=DEFAULT_MAX_IMAGE_PAGES, queries=DEFAULT_QUERIES):
+    """Generate each size and benchmark the selected tools; returns the results document"""
+    workdir = Path(workdir)
+    results = {}
+    skipped = {}
+
+    for records in sizes:
+        label = format_count(records)
+        size_dir = workdir / label
+        size_dir.mkdir(parents=True, exist_ok=True)
+        ndjson = size_dir / "bench-texpos.ndjson"
+
+        print(f"\n📄 Generating {label} records...")
+        stats = generate(ndjson, records, seed)
+        print(f"   {stats['records']} records on {stats['pages']} pages "
+              f"({ndjson.stat().st_size / 1e6:.1f} MB)")
+
+        images = None
+        if DRAW_TOOLS & set(tools):
+            if stats["pages"] <= max_image_pages:
+                images = size_dir / "pages" / "bench-page"
+                write_page_images(images, stats["pages"], dpi)
+            else:
+                reason = f"{stats['pages']} pages > --max-image-pages {max_image_pages}"
+                for tool in DRAW_TOOLS & set(tools):
+                    skipped[f"{tool}@{label}"] = reason
+
+        if NEEDS_BOXES & set(tools) and "convert" not in tools:
+            # Produce the marked-boxes JSON once, outside any measurement
+            measure("convert", ndjson, size_dir)
+
+        for tool in tools:
+            key = f"{tool}@{label}"
+            if key in skipped:
+                print(f"   ⏭️  {key}: skipped ({skipped[key]})")
+                continue
+            try:
+                runs = [measure(tool, ndjson, size_dir, images, workers, queries) for _ in range(repeat)]
+            except RuntimeError as e:
+                skipped[key] = str(e)
+                print(f"   ❌ {key}: {e}")
+                continue
+            results[key] = dict(summarize(runs), tool=tool, records=stats["records"], pages=stats["pages"])
+            print(f"   ✅ {key}: {format_result(results[key])}")
+
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "settings": {"repeat": repeat, "seed": seed, "workers": workers, "dpi": dpi, "queries": queries},
+        "results": results,
+        "skipped": skipped,
+    }
+
+def format_result(result):
+    return (f"{result['throughput']:,.0f} {result['unit']}/s, "
+            f"{result['latency_us']:,.2f} µs/{result['unit']}, "
+            f"{result['seconds']:.3f}s, peak {result['peak_rss_kb'] / 1024:.1f} MB")
+
+def compare_with_baseline(current, baseline, tolerance=DEFAULT_TOLERANCE, memory_tolerance=DEFAULT_TOLERANCE,
+                          min_delta=DEFAULT_MIN_DELTA_S):
+    """
+    Compare best time and peak RSS against a baseline document.
+
+    Returns a list of rows (key, metric, baseline, current, ratio, regressed);
+    a metric regresses when it grows by more than the tolerance (and, for
+    time, by at least min_delta seconds).
+    """
+    rows = []
+    for key, result in current["results"].items():
+        reference = baseline.get("results", {}).get(key)
+        if reference is None:
+            continue
+        for metric, limit in (("best_seconds", tolerance), ("peak_rss_kb", memory_tolerance)):
+            old, new = reference.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            ratio = new / old
+            regressed = ratio > 1 + limit
+            if metric == "best_seconds" and new - old < min_delta:
+                regressed = False
+            rows.append((key, metric, old, new, ratio, regressed))
+    return rows
+
+def print_comparison(rows, baseline_file):
+    print(f"\n📊 Comparison with {baseline_file}")
+    print("-" * 78)
+    print(f"{'Benchmark':<26} {'Metric':<13} {'Baseline':>12} {'Current':>12} {'Change':>10}")
+    print("-" * 78)
+    for key, metric, old, new, ratio, regressed in rows:
+        marker = " ❌" if regressed else ""
+        print(f"{key:<26} {metric:<13} {old:>12.4g} {new:>12.4g} {(ratio - 1) * 100:>+9.1f}%{marker}")
+    print("-" * 78)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the coordinate post-processing scripts on synthetic data")
+    parser.add_argument("--records", default="1k,100k", help="Comma-separated sizes, e.g. 1k,100k,1M,10M (default: 1k,100k)")
+    parser.add_argument("--tools", default=",".join(TOOLS), help=f"Comma-separated tools (default: all of {','.join(TOOLS)})")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per tool and size; the best run is compared (default: 3)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the synthetic data (default: 0)")
+    parser.add_argument("--workers", type=int, default=None, help="Render processes for the draw tools (default: CPU count)")
+    parser.add_argument("--dpi", type=float, default=72, help="Resolution of the generated page images (default: 72)")
+    parser.add_argument("--max-image-pages", type=int, default=DEFAULT_MAX_IMAGE_PAGES,
+                        help=f"Skip the draw tools above this many pages (default: {DEFAULT_MAX_IMAGE_PAGES})")
+    parser.add_argument("--queries", type=int, default=DEFAULT_QUERIES, help=f"Point queries for index-query (default: {DEFAULT_QUERIES})")
+    parser.add_argument("--workdir", type=Path, default=None, help="Keep generated data here (default: a temporary directory)")
+    parser.add_argument("--output", type=Path, default=None, help="Write the results JSON to this file")
+    parser.add_argument("--baseline", type=Path, default=None, help="Compare against this results file; exit 1 on regressions")
+    parser.add_argument("--save-baseline", type=Path, default=None, help="Write the results as a new baseline file")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help=f"Allowed slowdown before a time regression, as a fraction (default: {DEFAULT_TOLERANCE})")
+    parser.add_argument("--memory-tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help=f"Allowed peak RSS growth before a memory regression (default: {DEFAULT_TOLERANCE})")
+    parser.add_argument("--min-delta", type=float, default=DEFAULT_MIN_DELTA_S,
+                        help=f"Ignore slowdowns smaller than this many seconds (default: {DEFAULT_MIN_DELTA_S})")
+    # Internal: run a single tool in this process (used by the child processes)
+    parser.add_argument("--run-tool", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--ndjson", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--images", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--result", default=None, help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+
+    if args.run_tool:
+        result = run_tool(args.run_tool, args.ndjson, args.workdir, args.images, args.workers, args.queries, args.seed)
+        Path(args.result).write_text(json.dumps(result))
+        return
+
+    sizes = [parse_count(size) for size in args.records.split(",") if size.strip()]
+    tools = [tool.strip() for tool in args.tools.split(",") if tool.strip()]
+    unknown = [tool for tool in tools if tool not in TOOLS]
+    if unknown:
+        print(f"❌ Unknown tools: {', '.join(unknown)} (choose from {', '.join(TOOLS)})")
+        sys.exit(2)
+
+    baseline = None
+    if args.baseline:
+        if not args.baseline.exists():
+            print(f"❌ Baseline not found: {args.baseline}")
+            sys.exit(2)
+        baseline = json.loads(args.baseline.read_text())
+
+    workdir = args.workdir or Path(tempfile.mkdtemp(prefix="texpos-bench-"))
+    try:
+        current = run_benchmarks(
+            sizes, tools, workdir, repeat=max(1, args.repeat), seed=args.seed,
+            workers=args.workers, dpi=args.dpi, max_image_pages=args.max_image_pages,
+            queries=args.queries
+        )
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            path.write_text(json.dumps(current, indent=2))
+            print(f"\n💾 Results saved to {path}")
+
+    if baseline is None:
+        return
+
+    rows = compare_with_baseline(current, baseline, args.tolerance, args.memory_tolerance, args.min_delta)
+    print_comparison(rows, args.baseline)
+    regressions = [row for row in rows if row[-1]]
+    missing = sorted(set(baseline.get("results", {})) - set(current["results"]))
+    if missing:
+        print(f"⚠️  Not measured this run: {', '.join(missing)}")
+    if regressions:
+        print(f"❌ {len(regressions)} regression(s) beyond tolerance")
+        sys.exit(1)
+    print("✅ No regressions beyond tolerance")
+
+if __name__ == "__main__":
+    main()
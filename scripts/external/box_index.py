@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+"""
+Per-page spatial index over marked boxes
+
+Builds a uniform grid per page from the output of
+convert_ndjson_to_marked_boxes.py and answers point (hit-test), rectangle
+and nearest-neighbour queries without scanning every box. The index is
+saved as a binary sidecar (<name>-marked-boxes.idx) that loads straight
+into arrays, so lookups never have to re-parse the JSON.
+
+Coordinates are the x_pt/y_pt/w_pt/h_pt values from the JSON; a box covers
+[x_pt, x_pt + w_pt] x [y_pt, y_pt + h_pt].
+
+Usage:
+  python3 box_index.py build document-marked-boxes.json
+  python3 box_index.py point document-marked-boxes.idx 3 120.5 410
+  python3 box_index.py rect document-marked-boxes.idx 3 100 400 300 500
+  python3 box_index.py nearest document-marked-boxes.idx 3 120.5 410 -k 3
+"""
+
+import argparse
+import json
+import math
+import struct
+import sys
+from array import array
+from collections import namedtuple
+from pathlib import Path
+
+INDEX_MAGIC = b"MBIX"
+INDEX_VERSION = 1
+
+# Grid cell edge in points; about a line of body text high
+DEFAULT_CELL_SIZE = 32.0
+
+# Upper bound on cells per page axis; larger pages get coarser cells
+MAX_GRID_CELLS = 256
+
+# magic, version, cell size, boxes, pages, cells, cell items, id blob bytes
+HEADER = struct.Struct("<4sIdIIIII")
+
+Box = namedtuple("Box", ["id", "page", "x_pt", "y_pt", "w_pt", "h_pt"])
+
+def _array(typecode, values=()):
+    arr = array(typecode, values)
+    assert arr.itemsize in (4, 8)
+    return arr
+
+def _read_array(typecode, data, offset, count):
+    arr = _array(typecode)
+    end = offset + count * arr.itemsize
+    arr.frombytes(data[offset:end])
+    if sys.byteorder != "little":
+        arr.byteswap()
+    return arr, end
+
+class BoxIndex:
+    """Uniform-grid spatial index over the marked boxes of every page"""
+
+    def __init__(self, cell_size=DEFAULT_CELL_SIZE):
+        self.cell_size = float(cell_size)
+        self.x = _array("d")
+        self.y = _array("d")
+        self.w = _array("d")
+        self.h = _array("d")
+        self.id_offsets = _array("I", [0])
+        self.id_blob = b""
+        # Page table: one row per page
+        self.page_numbers = _array("i")
+        self.page_first = _array("I")
+        self.page_count = _array("I")
+        self.page_origin_x = _array("d")
+        self.page_origin_y = _array("d")
+        self.page_cell = _array("d")
+        self.page_cols = _array("i")
+        self.page_rows = _array("i")
+        self.page_cell_start = _array("I")
+        # CSR layout: items of cell c are cell_items[cell_offsets[c]:cell_offsets[c + 1]]
+        self.cell_offsets = _array("I", [0])
+        self.cell_items = _array("I")
+        self._page_slots = {}
+
+    # ------------------------------------------------------------------
+    # Building
+
+    @classmethod
+    def from_boxes(cls, boxes, cell_size=DEFAULT_CELL_SIZE):
+        """Build an index from marked-box dicts (as written by the converter)"""
+        index = cls(cell_size)
+        boxes = sorted(boxes, key=lambda box: box["page"])
+        id_blob = bytearray()
+
+        start = 0
+        while start < len(boxes):
+            page = boxes[start]["page"]
+            end = start
+            while end < len(boxes) and boxes[end]["page"] == page:
+                box = boxes[end]
+                index.x.append(float(box["x_pt"]))
+                index.y.append(float(box["y_pt"]))
+                index.w.append(float(box["w_pt"]))
+                index.h.append(float(box["h_pt"]))
+                id_blob += str(box["id"]).encode("utf-8")
+                index.id_offsets.append(len(id_blob))
+                end += 1
+            index._add_page(page, start, end)
+            start = end
+
+        index.id_blob = bytes(id_blob)
+        index._finish()
+        return index
+
+    @classmethod
+    def from_json(cls, json_file, cell_size=DEFAULT_CELL_SIZE):
+        with open(json_file, "r") as f:
+            return cls.from_boxes(json.load(f), cell_size)
+
+    def _add_page(self, page, first, end):
+        min_x = min(self.x[i] for i in range(first, end))
+        min_y = min(self.y[i] for i in range(first, end))
+        max_x = max(self.x[i] + self.w[i] for i in range(first, end))
+        max_y = max(self.y[i] + self.h[i] for i in range(first, end))
+
+        cell = max(self.cell_size, (max_x - min_x) / MAX_GRID_CELLS, (max_y - min_y) / MAX_GRID_CELLS)
+        cols = max(1, math.ceil((max_x - min_x) / cell))
+        rows = max(1, math.ceil((max_y - min_y) / cell))
+        grid = (min_x, min_y, cell, cols, rows)
+
+        buckets = [[] for _ in range(cols * rows)]
+        for i in range(first, end):
+            c0, r0 = self._cell_of(grid, self.x[i], self.y[i])
+            c1, r1 = self._cell_of(grid, self.x[i] + self.w[i], self.y[i] + self.h[i])
+            for r in range(r0, r1 + 1):
+                for c in range(c0, c1 + 1):
+                    buckets[r * cols + c].append(i)
+
+        self.page_numbers.append(int(page))
+        self.page_first.append(first)
+        self.page_count.append(end - first)
+        self.page_origin_x.append(min_x)
+        self.page_origin_y.append(min_y)
+        self.page_cell.append(cell)
+        self.page_cols.append(cols)
+        self.page_rows.append(rows)
+        self.page_cell_start.append(len(self.cell_offsets) - 1)
+        for bucket in buckets:
+            self.cell_items.extend(bucket)
+            self.cell_offsets.append(len(self.cell_items))
+
+    @staticmethod
+    def _cell_of(grid, x, y):
+        """Grid cell (col, row) containing a point, clamped to the grid"""
+        origin_x, origin_y, cell, cols, rows = grid
+        c = int((x - origin_x) // cell)
+        r = int((y - origin_y) // cell)
+        return min(max(c, 0), cols - 1), min(max(r, 0), rows - 1)
+
+    @staticmethod
+    def _in_grid(grid, x, y):
+        origin_x, origin_y, cell, cols, rows = grid
+        return origin_x <= x <= origin_x + cols * cell and origin_y <= y <= origin_y + rows * cell
+
+    def _finish(self):
+        self._page_slots = {page: slot for slot, page in enumerate(self.page_numbers)}
+
+    # ------------------------------------------------------------------
+    # Serialization
+
+    def save(self, index_file):
+        """Write the index as a binary sidecar file"""
+        arrays = [
+            self.x, self.y, self.w, self.h, self.id_offsets,
+            self.page_numbers, self.page_first, self.page_count,
+            self.page_origin_x, self.page_origin_y, self.page_cell, self.page_cols, self.page_rows,
+            self.page_cell_start, self.cell_offsets, self.cell_items,
+        ]
+        with open(index_file, "wb") as f:
+            f.write(HEADER.pack(
+                INDEX_MAGIC, INDEX_VERSION, self.cell_size, len(self.x),
+                len(self.page_numbers), len(self.cell_offsets) - 1,
+                len(self.cell_items), len(self.id_blob)
+            ))
+            for arr in arrays:
+                if sys.byteorder != "little":
+                    arr = array(arr.typecode, arr)
+                    arr.byteswap()
+                f.write(arr.tobytes())
+            f.write(self.id_blob)
+        return index_file
+
+    @classmethod
+    def load(cls, index_file):
+        """Load an index written by save()"""
+        data = Path(index_file).read_bytes()
+        magic, version, cell_size, n_boxes, n_pages, n_cells, n_items, id_bytes = \
+            HEADER.unpack_from(data, 0)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            raise ValueError(f"{index_file} is not a version {INDEX_VERSION} box index")
+
+        index = cls(cell_size)
+        offset = HEADER.size
+        layout = [
+            ("x", "d", n_boxes), ("y", "d", n_boxes), ("w", "d", n_boxes), ("h", "d", n_boxes),
+            ("id_offsets", "I", n_boxes + 1),
+            ("page_numbers", "i", n_pages), ("page_first", "I", n_pages),
+            ("page_count", "I", n_pages), ("page_origin_x", "d", n_pages),
+            ("page_origin_y", "d", n_pages), ("page_cell", "d", n_pages),
+            ("page_cols", "i", n_pages),
+            ("page_rows", "i", n_pages), ("page_cell_start", "I", n_pages),
+            ("cell_offsets", "I", n_cells + 1), ("cell_items", "I", n_items),
+        ]
+        for name, typecode, count in layout:
+            arr, offset = _read_array(typecode, data, offset, count)
+            setattr(index, name, arr)
+        index.id_blob = data[offset:offset + id_bytes]
+        index._finish()
+        return index
+
+    # ------------------------------------------------------------------
+    # Queries
+
+    @property
+    def pages(self):
+        return list(self.page_numbers)
+
+    def __len__(self):
+        return len(self.x)
+
+    def box(self, i):
+        """Box record for a global box index"""
+        box_id = self.id_blob[self.id_offsets[i]:self.id_offsets[i + 1]].decode("utf-8")
+        slot = self._slot_of_box(i)
+        return Box(box_id, self.page_numbers[slot], self.x[i], self.y[i], self.w[i], self.h[i])
+
+    def _slot_of_box(self, i):
+        lo, hi = 0, len(self.page_first) - 1
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if self.page_first[mid] <= i:
+                lo = mid
+            else:
+                hi = mid - 1
+        return lo
+
+    def _cells(self, slot, c0, r0, c1, r1):
+        """Yield box indices stored in the cell range of a page (may repeat)"""
+        cols = self.page_cols[slot]
+        base = self.page_cell_start[slot]
+        offsets = self.cell_offsets
+        items = self.cell_items
+        for r in range(r0, r1 + 1):
+            row = base + r * cols
+            for c in range(c0, c1 + 1):
+                cell = row + c
+                yield from items[offsets[cell]:offsets[cell + 1]]
+
+    def _grid(self, slot):
+        return (self.page_origin_x[slot], self.page_origin_y[slot], self.page_cell[slot],
+                self.page_cols[slot], self.page_rows[slot])
+
+    def point_indices(self, page, x, y):
+        """Indices of boxes containing (x, y), smallest box first"""
+        slot = self._page_slots.get(page)
+        if slot is None:
+            return []
+        grid = self._grid(slot)
+        if not self._in_grid(grid, x, y):
+            return []
+        c, r = self._cell_of(grid, x, y)
+
+        hits = [
+            i for i in self._cells(slot, c, r, c, r)
+            if self.x[i] <= x <= self.x[i] + self.w[i] and self.y[i] <= y <= self.y[i] + self.h[i]
+        ]
+        hits.sort(key=lambda i: (self.w[i] * self.h[i], i))
+        return hits
+
+    def rect_indices(self, page, x0, y0, x1, y1):
+        """Indices of boxes intersecting the rectangle, in box order"""
+        slot = self._page_slots.get(page)
+        if slot is None:
+            return []
+        x0, x1 = min(x0, x1), max(x0, x1)
+        y0, y1 = min(y0, y1), max(y0, y1)
+        grid = self._grid(slot)
+        c0, r0 = self._cell_of(grid, x0, y0)
+        c1, r1 = self._cell_of(grid, x1, y1)
+
+        hits = {
+            i for i in self._cells(slot, c0, r0, c1, r1)
+            if self.x[i] <= x1 and x0 <= self.x[i] + self.w[i]
+            and self.y[i] <= y1 and y0 <= self.y[i] + self.h[i]
+        }
+        return sorted(hits)
+
+    def _distance(self, i, x, y):
+        dx = max(self.x[i] - x, 0.0, x - (self.x[i] + self.w[i]))
+        dy = max(self.y[i] - y, 0.0, y - (self.y[i] + self.h[i]))
+        return math.hypot(dx, dy)
+
+    def nearest_indices(self, page, x, y, k=1):
+        """(distance, index) of the k boxes closest to (x, y); 0 means inside"""
+        slot = self._page_slots.get(page)
+        if slot is None or k <= 0:
+            return []
+        grid = self._grid(slot)
+        _, _, cell, cols, rows = grid
+        first = self.page_first[slot]
+        count = self.page_count[slot]
+
+        if not self._in_grid(grid, x, y):
+            # Outside the grid the ring bound does not hold; pages are small enough to scan
+            scored = sorted((self._distance(i, x, y), i) for i in range(first, first + count))
+            return scored[:k]
+
+        c, r = self._cell_of(grid, x, y)
+        seen = set()
+        scored = []
+        for ring in range(max(cols, rows)):
+            c0, c1 = c - ring, c + ring
+            r0, r1 = r - ring, r + ring
+            for rr in range(max(r0, 0), min(r1, rows - 1) + 1):
+                edge_row = rr in (r0, r1)
+                for cc in range(max(c0, 0), min(c1, cols - 1) + 1):
+                    if not edge_row and cc not in (c0, c1):
+                        continue
+                    for i in self._cells(slot, cc, rr, cc, rr):
+                        if i not in seen:
+                            seen.add(i)
+                            scored.append((self._distance(i, x, y), i))
+            # Boxes not seen yet lie in rings beyond this one, at least
+            # ring * cell_size away from the query point
+            if len(scored) >= k:
+                scored.sort()
+                if scored[k - 1][0] <= ring * cell:
+                    break
+        scored.sort()
+        return scored[:k]
+
+    def query_point(self, page, x, y):
+        """Boxes under a point on a page, innermost (smallest) first"""
+        return [self.box(i) for i in self.point_indices(page, x, y)]
+
+    def query_rect(self, page, x0, y0, x1, y1):
+        """Boxes intersecting a rectangle on a page"""
+        return [self.box(i) for i in self.rect_indices(page, x0, y0, x1, y1)]
+
+    def nearest(self, page, x, y, k=1):
+        """The k boxes closest to a point as (distance, Box) pairs"""
+        return [(d, self.box(i)) for d, i in self.nearest_indices(page, x, y, k)]
+
+    def query_points(self, points):
+        """Batch hit-test: one result list per (page, x, y)"""
+        return [self.query_point(page, x, y) for page, x, y in points]
+
+    def query_rects(self, rects):
+        """Batch region query: one result list per (page, x0, y0, x1, y1)"""
+        return [self.query_rect(*rect) for rect in rects]
+
+def index_path_for(json_file):
+    """Sidecar path next to a marked-boxes JSON file"""
+    return Path(json_file).with_suffix(".idx")
+
+def build_index_file(json_file, index_file=None, cell_size=DEFAULT_CELL_SIZE):
+    """Build and save the sidecar index for a marked-boxes JSON file"""
+    index = BoxIndex.from_json(json_file, cell_size)
+    index_file = index_file or index_path_for(json_file)
+    index.save(index_file)
+    return index_file, index
+
+def open_index(path):
+    """Load a sidecar index, or build one in memory from a JSON file"""
+    path = Path(path)
+    if path.suffix == ".json":
+        sidecar = index_path_for(path)
+        if sidecar.exists() and sidecar.stat().st_mtime >= path.stat().st_mtime:
+            return BoxIndex.load(sidecar)
+        return BoxIndex.from_json(path)
+    return BoxIndex.load(path)
+
+def main():
+    parser = argparse.ArgumentParser(description="Spatial index and hit-testing over marked boxes")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="Build the sidecar index for a marked-boxes JSON file")
+    build.add_argument("json_file", type=Path)
+    build.add_argument("-o", "--output", type=Path, default=None, help="Index file (default: <json>.idx)")
+    build.add_argument("--cell-size", type=float, default=DEFAULT_CELL_SIZE,
+                       help=f"Grid cell size in pt (default: {DEFAULT_CELL_SIZE})")
+
+    point = sub.add_parser("point", help="Boxes under a point")
+    point.add_argument("index", type=Path, help="Index (.idx) or marked-boxes JSON file")
+    point.add_argument("page", type=int)
+    point.add_argument("x", type=float)
+    point.add_argument("y", type=float)
+
+    rect = sub.add_parser("rect", help="Boxes intersecting a rectangle")
+    rect.add_argument("index", type=Path, help="Index (.idx) or marked-boxes JSON file")
+    rect.add_argument("page", type=int)
+    for name in ("x0", "y0", "x1", "y1"):
+        rect.add_argument(name, type=float)
+
+    nearest = sub.add_parser("nearest", help="Boxes closest to a point")
+    nearest.add_argument("index", type=Path, help="Index (.idx) or marked-boxes JSON file")
+    nearest.add_argument("page", type=int)
+    nearest.add_argument("x", type=float)
+    nearest.add_argument("y", type=float)
+    nearest.add_argument("-k", type=int, default=1, help="Number of neighbours (default: 1)")
+
+    args = parser.parse_args()
+
+    if args.command == "build":
+        index_file, index = build_index_file(args.json_file, args.output, args.cell_size)
+        print(f"Indexed {len(index)} boxes on {len(index.pages)} pages: {index_file}")
+        return
+
+    index = open_index(args.index)
+    if args.command == "point":
+        results = [box._asdict() for box in index.query_point(args.page, args.x, args.y)]
+    elif args.command == "rect":
+        results = [box._asdict() for box in
+                   index.query_rect(args.page, args.x0, args.y0, args.x1, args.y1)]
+    else:
+        results = [dict(box._asdict(), distance=round(distance, 2))
+                   for distance, box in index.nearest(args.page, args.x, args.y, args.k)]
+
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
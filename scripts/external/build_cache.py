@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Content-addressed build cache for PDF + JSON builds
+
+A build is keyed by a SHA-256 over the .tex file, every file it pulls in
+with \\input/\\include, the coordinate macros (TeX-lib/geom-marks.tex) and
+the images it includes. On a hit the cached PDF, -boxes.json and
+-texpos.ndjson are restored without running LaTeX.
+
+Only the newest entry per .tex file is kept, and the least recently used
+entries beyond max_entries are dropped whenever a build is stored.
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+# Bump when the key layout changes so old entries are never reused
+CACHE_VERSION = 2
+
+# Entries kept in total; the least recently used beyond this are removed
+MAX_CACHE_ENTRIES = 1000
+
+# Build outputs stored per entry (relative to the job name)
+CACHED_SUFFIXES = [".pdf", "-boxes.json", "-boxes.mbx", "-texpos.ndjson", ".aux"]
+
+INPUT_PATTERN = re.compile(r"\\(?:input|include)\s*\{([^}]+)\}")
+GRAPHICS_PATTERN = re.compile(r"\\(?:safe)?includegraphics\s*(?:\[[^\]]*\])?\s*\{([^}]+)\}")
+IMAGE_EXTENSIONS = ["", ".pdf", ".png", ".jpg", ".jpeg", ".eps"]
+
+def hash_file(path, chunk_size=1 << 20):
+    """Return the SHA-256 hex digest of a file's contents, or None if missing"""
+    path = Path(path)
+    if not path.exists():
+        return None
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def strip_comments(text):
+    """Drop TeX comments so commented-out inputs are not treated as dependencies"""
+    return re.sub(r"(?<!\\)%.*", "", text)
+
+def find_dependencies(tex_path, extra_files=(), base_dir=None):
+    """Return the .tex file and every file it depends on, in a stable order
+
+    Relative \\input and \\includegraphics paths are resolved against
+    base_dir, the directory LaTeX runs in (default: the .tex file's own).
+    """
+    tex_path = Path(tex_path).resolve()
+    base_dir = Path(base_dir).resolve() if base_dir else tex_path.parent
+    seen = []
+    pending = [tex_path]
+
+    while pending:
+        current = pending.pop(0)
+        if current in seen or not current.exists():
+            continue
+        seen.append(current)
+
+        text = strip_comments(current.read_text(errors="replace"))
+        for name in INPUT_PATTERN.findall(text):
+            candidate = (base_dir / name.strip()).resolve()
+            if candidate.suffix != ".tex" and not candidate.exists():
+                candidate = candidate.with_name(candidate.name + ".tex")
+            pending.append(candidate)
+
+        for name in GRAPHICS_PATTERN.findall(text):
+            # Template placeholders or macro arguments are not real files
+            if "#" in name or "[[" in name:
+                continue
+            for ext in IMAGE_EXTENSIONS:
+                candidate = (base_dir / f"{name.strip()}{ext}").resolve()
+                if candidate.is_file():
+                    if candidate not in seen:
+                        seen.append(candidate)
+                    break
+
+    for extra in extra_files:
+        extra = Path(extra).resolve()
+        if extra.exists() and extra not in seen:
+            seen.append(extra)
+
+    return seen
+
+class BuildCache:
+    def __init__(self, cache_dir, max_entries=MAX_CACHE_ENTRIES):
+        self.cache_dir = Path(cache_dir)
+        self.max_entries = max_entries
+
+    def compute_key(self, tex_path, extra_files=(), options=None, base_dir=None):
+        """Hash the build inputs into a cache key; returns (key, dependency list)
+
+        base_dir is the LaTeX working directory (default: the .tex file's own).
+        """
+        tex_path = Path(tex_path).resolve()
+        base_dir = Path(base_dir).resolve() if base_dir else tex_path.parent
+        dependencies = find_dependencies(tex_path, extra_files, base_dir)
+
+        digest = hashlib.sha256()
+        digest.update(f"v{CACHE_VERSION}\n".encode())
+        digest.update(json.dumps(options or {}, sort_keys=True).encode())
+        for dep in dependencies:
+            # Paths relative to the working directory keep keys stable across checkouts
+            rel = os.path.relpath(dep, base_dir)
+            digest.update(f"\n{rel}\0{hash_file(dep)}".encode())
+
+        return digest.hexdigest(), [str(dep) for dep in dependencies]
+
+    def entry_dir(self, key):
+        return self.cache_dir / key[:2] / key
+
+    def restore(self, key, tex_name, output_dir):
+        """Copy a cached entry into output_dir; returns the restored paths or None"""
+        entry = self.entry_dir(key)
+        manifest_path = entry / "manifest.json"
+        if not manifest_path.exists():
+            return None
+
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        restored = []
+        try:
+            for suffix in manifest.get("files", []):
+                src = entry / f"entry{suffix}"
+                dst = output_dir / f"{tex_name}{suffix}"
+                shutil.copy2(src, dst)
+                restored.append(dst)
+            # The manifest's mtime is the entry's last use, for pruning
+            os.utime(manifest_path)
+        except OSError:
+            # Entry removed by a concurrent prune
+            return None
+        return restored
+
+    def store(self, key, tex_name, output_dir, dependencies=()):
+        """Save build outputs from output_dir under key; returns the entry path"""
+        output_dir = Path(output_dir)
+        entry = self.entry_dir(key)
+        if (entry / "manifest.json").exists():
+            os.utime(entry / "manifest.json")
+            return entry
+
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        # Populate a temporary directory and rename it so concurrent builds
+        # never observe a half-written entry
+        staging = Path(tempfile.mkdtemp(dir=entry.parent, prefix=".tmp-"))
+        try:
+            files = []
+            for suffix in CACHED_SUFFIXES:
+                src = output_dir / f"{tex_name}{suffix}"
+                if src.exists():
+                    shutil.copy2(src, staging / f"entry{suffix}")
+                    files.append(suffix)
+
+            manifest = {
+                "key": key,
+                "tex_name": tex_name,
+                # The .tex file itself; older entries for it are superseded
+                "source": str(dependencies[0]) if dependencies else tex_name,
+                "files": files,
+                "dependencies": list(dependencies),
+                "created": datetime.now().isoformat()
+            }
+            with open(staging / "manifest.json", 'w') as f:
+                json.dump(manifest, f, indent=2)
+
+            try:
+                staging.rename(entry)
+            except OSError:
+                # Another build stored the same key first
+                pass
+        finally:
+            if staging.exists():
+                shutil.rmtree(staging, ignore_errors=True)
+
+        self.prune(keep=key)
+        return entry
+
+    def entries(self):
+        """Yield (entry path, last use, manifest) for every complete entry"""
+        for manifest_path in self.cache_dir.glob("*/*/manifest.json"):
+            entry = manifest_path.parent
+            # Skip staging and removal directories
+            if entry.name.startswith("."):
+                continue
+            try:
+                with open(manifest_path, 'r') as f:
+                    manifest = json.load(f)
+                yield entry, manifest_path.stat().st_mtime, manifest
+            except (OSError, ValueError):
+                continue
+
+    def prune(self, keep=None):
+        """Drop superseded and least recently used entries; returns the removed keys
+
+        An entry is superseded by a newer one for the same .tex file. Beyond
+        that at most max_entries are kept. The entry keyed ``keep`` never goes.
+        """
+        entries = sorted(self.entries(), key=lambda item: (item[0].name == keep, item[1]), reverse=True)
+        sources = set()
+        kept = 0
+        removed = []
+        for entry, _, manifest in entries:
+            source = manifest.get("source")
+            superseded = source in sources
+            sources.add(source)
+            if entry.name != keep and (superseded or kept >= self.max_entries):
+                if self._remove(entry):
+                    removed.append(entry.name)
+            else:
+                kept += 1
+        return removed
+
+    def _remove(self, entry):
+        # Rename first so no reader ever sees a half-deleted entry
+        doomed = entry.with_name(f".del-{entry.name}-{os.getpid()}")
+        try:
+            entry.rename(doomed)
+        except OSError:
+            return False
+        shutil.rmtree(doomed, ignore_errors=True)
+        return True
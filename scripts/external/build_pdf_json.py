@@ -10,6 +10,7 @@ This script:
 5. Provides build status and error handling
 
 Usage: python3 build_pdf_json.py [options]
+       python3 build_pdf_json.py "articles/*.tex" --jobs 8   # batch mode
 """
 
 import os
@@ -17,40 +18,188 @@ import sys
 import subprocess
 import json
 import argparse
+import glob
 import shutil
+import time
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from logging.handlers import RotatingFileHandler
 from pathlib import Path
 from datetime import datetime
 
+from build_cache import BuildCache, hash_file
+from marked_boxes_binary import open_fresh as open_binary_boxes
+
+# Upper bound on LaTeX passes while waiting for the .aux file to settle
+MAX_LATEX_RUNS = 5
+
+# Entries kept in build_log (and the report); older ones are dropped
+MAX_LOG_ENTRIES = 1000
+
+# Trailing subprocess output lines kept in memory for error messages
+OUTPUT_TAIL_LINES = 40
+
+# Rotating subprocess output log: size per file and number of backups
+OUTPUT_LOG_BYTES = 5 * 1024 * 1024
+OUTPUT_LOG_BACKUPS = 3
+
+# ru_maxrss is in kilobytes on Linux and bytes on macOS
+RSS_DIVISOR = 1024 if sys.platform == "darwin" else 1
+
 class PDFJSONBuilder:
-    def __init__(self, tex_dir="TeX", output_dir=None):
+    def __init__(self, tex_dir="TeX", output_dir=None, timeout=None, echo=True,
+                 use_cache=True, cache_dir=None, max_runs=MAX_LATEX_RUNS):
         self.tex_dir = Path(tex_dir)
+        # Build outputs (PDF, aux, NDJSON, JSON, report) are written here;
+        # a separate directory isolates concurrent builds from each other
         self.output_dir = Path(output_dir) if output_dir else self.tex_dir
-        self.build_log = []
+        self.cache = BuildCache(cache_dir or self.tex_dir / ".build-cache") if use_cache else None
+        self.max_runs = max_runs
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self.echo = echo
+        self.build_log = deque(maxlen=MAX_LOG_ENTRIES)
+        self.started = time.monotonic()
+        self.spans = []
+        self._span = None
+        self.output_handler = None
+
+    @contextmanager
+    def stage(self, name):
+        """Time a build stage: wall and CPU time plus CPU and peak RSS of its child processes"""
+        span = {
+            "name": name,
+            "start_s": round(time.monotonic() - self.started, 3),
+            "child_cpu_s": 0.0,
+            "child_peak_rss_kb": 0,
+            "commands": 0
+        }
+        outer, self._span = self._span, span
+        wall_start = time.monotonic()
+        cpu_start = time.process_time()
+        try:
+            yield span
+        finally:
+            span["wall_s"] = round(time.monotonic() - wall_start, 3)
+            span["cpu_s"] = round(time.process_time() - cpu_start, 3)
+            span["child_cpu_s"] = round(span["child_cpu_s"], 3)
+            self.spans.append(span)
+            self._span = outer
+
+    def timings(self):
+        """Stage spans plus the total wall time so far"""
+        return {
+            "total_wall_s": round(time.monotonic() - self.started, 3),
+            "stages": list(self.spans)
+        }
+
+    def open_output_log(self, tex_name):
+        """Stream subprocess output for this build to a rotating log file"""
+        self.close_output_log()
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        log_path = self.output_dir / f"{tex_name}-build-output.log"
+        # The handler is used directly rather than through a named logger, so
+        # builders (and batch retries) never leave registered loggers behind
+        handler = RotatingFileHandler(log_path, maxBytes=OUTPUT_LOG_BYTES, backupCount=OUTPUT_LOG_BACKUPS)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        self.output_handler = handler
+        self.output_log_path = log_path
+
+    def close_output_log(self):
+        if self.output_handler is None:
+            return
+        self.output_handler.close()
+        self.output_handler = None
+
+    def write_output(self, line):
+        """Append one line of subprocess output to the rotating output log"""
+        self.output_handler.handle(logging.makeLogRecord({
+            "msg": line, "levelno": logging.INFO, "levelname": "INFO"
+        }))
 
     def log(self, message, level="INFO"):
         timestamp = datetime.now().strftime("%H:%M:%S")
         log_entry = f"[{timestamp}] {level}: {message}"
         self.build_log.append(log_entry)
-        print(log_entry)
+        if self.echo:
+            print(log_entry)
 
     def run_command(self, cmd, cwd=None):
-        """Run a shell command and capture output"""
+        """Run a command, streaming its output line by line to the output log"""
         self.log(f"Running: {' '.join(cmd)}")
+        timeout = None
+        if self.deadline is not None:
+            timeout = self.deadline - time.monotonic()
+            if timeout <= 0:
+                self.log("Build timed out", "ERROR")
+                return False, "", ""
+
+        tail = deque(maxlen=OUTPUT_TAIL_LINES)
         try:
-            result = subprocess.run(
+            proc = subprocess.Popen(
                 cmd,
                 cwd=cwd or self.tex_dir,
-                capture_output=True,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
                 text=True,
-                check=True
+                errors="replace"
             )
-            if result.stdout:
-                self.log(f"Output: {result.stdout.strip()}")
-            return True, result.stdout, result.stderr
-        except subprocess.CalledProcessError as e:
+        except OSError as e:
             self.log(f"Error running command: {e}", "ERROR")
-            self.log(f"Stderr: {e.stderr}", "ERROR")
-            return False, e.stdout, e.stderr
+            return False, "", str(e)
+
+        timed_out = threading.Event()
+        timer = None
+        if timeout is not None:
+            def kill():
+                timed_out.set()
+                proc.kill()
+            timer = threading.Timer(timeout, kill)
+            timer.start()
+
+        line_count = 0
+        try:
+            for line in proc.stdout:
+                line = line.rstrip("\n")
+                tail.append(line)
+                line_count += 1
+                if self.output_handler is not None:
+                    self.write_output(line)
+            proc.stdout.close()
+            returncode, usage = self._wait(proc)
+        finally:
+            if timer is not None:
+                timer.cancel()
+
+        if usage is not None and self._span is not None:
+            self._span["commands"] += 1
+            self._span["child_cpu_s"] += usage.ru_utime + usage.ru_stime
+            self._span["child_peak_rss_kb"] = max(self._span["child_peak_rss_kb"],
+                                                  usage.ru_maxrss // RSS_DIVISOR)
+
+        output = "\n".join(tail)
+        if line_count and self.output_handler is not None:
+            self.log(f"Output: {line_count} lines streamed to {self.output_log_path.name}")
+
+        if timed_out.is_set():
+            self.log(f"Build timed out running: {' '.join(cmd)}", "ERROR")
+            return False, output, ""
+        if returncode != 0:
+            self.log(f"Error running command: {' '.join(cmd)} returned {returncode}", "ERROR")
+            self.log(f"Last output: {output}", "ERROR")
+            return False, output, ""
+        return True, output, ""
+
+    @staticmethod
+    def _wait(proc):
+        """Reap the child, returning (exit code, rusage of that child or None)"""
+        if hasattr(os, "wait4"):
+            _, status, usage = os.wait4(proc.pid, 0)
+            proc.returncode = os.waitstatus_to_exitcode(status)
+            return proc.returncode, usage
+        return proc.wait(), None
 
     def check_dependencies(self):
         """Check if required tools are available"""
@@ -73,39 +222,91 @@ class PDFJSONBuilder:
         self.log("Cleaning build files...")
         extensions = [".aux", ".log", ".fls", ".fdb_latexmk", ".synctex.gz"]
         for ext in extensions:
-            file_path = self.tex_dir / f"{tex_name}{ext}"
+            file_path = self.output_dir / f"{tex_name}{ext}"
             if file_path.exists():
                 file_path.unlink()
                 self.log(f"Removed {file_path.name}")
 
+    def rerun_state(self, tex_name):
+        """Hash the .aux file; a change between runs means LaTeX must run again
+
+        Each run reads the .aux written by the previous one (zref positions and
+        pages included), so once it stops changing the next NDJSON would be
+        identical too and no further run is needed.
+        """
+        return hash_file(self.output_dir / f"{tex_name}.aux")
+
     def build_pdf(self, tex_file, clean_first=True):
         """Build PDF from LaTeX file"""
         tex_path = Path(tex_file)
         tex_name = tex_path.stem
 
+        cache_key = None
+        dependencies = []
+        if self.cache:
+            with self.stage("cache-lookup"):
+                geom_marks = self.tex_dir.parent / "TeX-lib" / "geom-marks.tex"
+                cache_key, dependencies = self.cache.compute_key(
+                    self.tex_dir / tex_path,
+                    extra_files=[geom_marks],
+                    options={"engine": "lualatex"},
+                    base_dir=self.tex_dir
+                )
+                restored = self.cache.restore(cache_key, tex_name, self.output_dir)
+            if restored:
+                self.log(f"Cache hit {cache_key[:12]}: restored {', '.join(p.name for p in restored)}")
+                return True
+            self.log(f"Cache miss {cache_key[:12]} ({len(dependencies)} inputs)")
+
+        # Only needed when LaTeX actually runs
+        with self.stage("dependency-check"):
+            if not self.check_dependencies():
+                return False
+
         if clean_first:
-            self.clean_build_files(tex_name)
+            with self.stage("clean"):
+                self.clean_build_files(tex_name)
 
         self.log(f"Building PDF from {tex_file}...")
 
-        # Run lualatex twice (for proper cross-references)
-        for run_num in [1, 2]:
-            self.log(f"LaTeX run {run_num}/2")
-            success, stdout, stderr = self.run_command([
-                "lualatex",
-                "-interaction=nonstopmode",
-                "-file-line-error",
-                tex_file
-            ])
+        cmd = ["lualatex", "-interaction=nonstopmode", "-file-line-error"]
+        if self.output_dir != self.tex_dir:
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+            cmd.append(f"-output-directory={self.output_dir.resolve()}")
+        cmd.append(str(tex_file))
+
+        # Rerun lualatex until the .aux reaches a fixed point (zref page
+        # numbers and positions always come from the previous run)
+        state = self.rerun_state(tex_name)
+        converged = False
+        for run_num in range(1, self.max_runs + 1):
+            self.log(f"LaTeX run {run_num} (max {self.max_runs})")
+            with self.stage(f"latex-pass-{run_num}"):
+                success, stdout, stderr = self.run_command(cmd)
 
             if not success:
                 self.log(f"LaTeX compilation failed on run {run_num}", "ERROR")
                 return False
 
+            new_state = self.rerun_state(tex_name)
+            if new_state == state:
+                self.log(f"Cross-references stable after {run_num} run(s)")
+                converged = True
+                break
+            state = new_state
+
+        if not converged:
+            self.log(f"Cross-references still changing after {self.max_runs} runs; "
+                     "page numbers may be inaccurate", "WARNING")
+
         # Check if PDF was created
-        pdf_path = self.tex_dir / f"{tex_name}.pdf"
+        pdf_path = self.output_dir / f"{tex_name}.pdf"
         if pdf_path.exists():
             self.log(f"PDF created successfully: {pdf_path}")
+            if self.cache and converged:
+                with self.stage("cache-store"):
+                    entry = self.cache.store(cache_key, tex_name, self.output_dir, dependencies)
+                self.log(f"Cached build outputs: {entry}")
             return True
         else:
             self.log("PDF was not created", "ERROR")
@@ -113,12 +314,23 @@ class PDFJSONBuilder:
 
     def validate_json(self, json_file):
         """Validate and enhance the generated JSON file"""
-        json_path = self.tex_dir / json_file
+        json_path = self.output_dir / json_file
 
         if not json_path.exists():
             self.log(f"JSON file not found: {json_file}", "ERROR")
             return False
 
+        boxes = open_binary_boxes(json_path, verify=True)
+        if boxes is not None:
+            # The sidecar was written with this exact JSON (size and SHA-256
+            # match) and has a fixed schema, so only the dimensions need checking
+            self.log(f"Binary sidecar loaded with {len(boxes)} items")
+            invalid = boxes.invalid_dimensions()
+            for i in invalid:
+                self.log(f"Item {boxes.id_at(i)} has invalid dimensions", "WARNING")
+            boxes.close()
+            return True
+
         try:
             with open(json_path, 'r') as f:
                 data = json.load(f)
@@ -149,28 +361,37 @@ class PDFJSONBuilder:
             "tex_file": f"{tex_name}.tex",
             "pdf_file": f"{tex_name}.pdf",
             "json_file": f"{tex_name}-boxes.json",
-            "build_log": self.build_log
+            "output_log": f"{tex_name}-build-output.log",
+            "timings": self.timings(),
+            "build_log": list(self.build_log)
         }
 
         # Add file sizes and stats
-        pdf_path = self.tex_dir / f"{tex_name}.pdf"
-        json_path = self.tex_dir / f"{tex_name}-boxes.json"
+        pdf_path = self.output_dir / f"{tex_name}.pdf"
+        json_path = self.output_dir / f"{tex_name}-boxes.json"
 
         if pdf_path.exists():
             report["pdf_size_bytes"] = pdf_path.stat().st_size
 
         if json_path.exists():
             report["json_size_bytes"] = json_path.stat().st_size
-            try:
-                with open(json_path, 'r') as f:
-                    data = json.load(f)
-                report["coordinate_count"] = len(data)
-                report["coordinate_items"] = [item["id"] for item in data]
-            except:
-                pass
+            boxes = open_binary_boxes(json_path)
+            if boxes is not None:
+                report["binary_size_bytes"] = boxes.path.stat().st_size
+                report["coordinate_count"] = len(boxes)
+                report["coordinate_items"] = boxes.ids()
+                boxes.close()
+            else:
+                try:
+                    with open(json_path, 'r') as f:
+                        data = json.load(f)
+                    report["coordinate_count"] = len(data)
+                    report["coordinate_items"] = [item["id"] for item in data]
+                except:
+                    pass
 
         # Save report
-        report_path = self.tex_dir / f"{tex_name}-build-report.json"
+        report_path = self.output_dir / f"{tex_name}-build-report.json"
         with open(report_path, 'w') as f:
             json.dump(report, f, indent=2)
 
@@ -185,14 +406,14 @@ class PDFJSONBuilder:
             return False
 
         # Copy PDF
-        pdf_src = self.tex_dir / f"{tex_name}.pdf"
+        pdf_src = self.output_dir / f"{tex_name}.pdf"
         pdf_dst = ui_dir / f"{tex_name}.pdf"
         if pdf_src.exists():
             shutil.copy2(pdf_src, pdf_dst)
             self.log(f"Copied PDF to UI: {pdf_dst}")
 
         # Copy JSON
-        json_src = self.tex_dir / f"{tex_name}-boxes.json"
+        json_src = self.output_dir / f"{tex_name}-boxes.json"
         json_dst = ui_dir / f"{tex_name}-boxes.json"
         if json_src.exists():
             shutil.copy2(json_src, json_dst)
@@ -200,61 +421,308 @@ class PDFJSONBuilder:
 
         return True
 
-    def build_all(self, tex_file, copy_to_ui=True, clean_first=True):
+    def build_all(self, tex_file, copy_to_ui=True, clean_first=True, metrics_file=None):
         """Complete build process"""
-        self.log("=== Starting PDF + JSON Build Process ===")
+        tex_name = Path(tex_file).stem
+        self.open_output_log(tex_name)
+        try:
+            success = self._build_all(tex_file, tex_name, copy_to_ui, clean_first)
+        finally:
+            self.close_output_log()
 
-        if not self.check_dependencies():
-            return False
+        if metrics_file:
+            self.write_metrics(metrics_file, tex_file, success)
+        return success
 
-        tex_name = Path(tex_file).stem
+    def _build_all(self, tex_file, tex_name, copy_to_ui, clean_first):
+        self.log("=== Starting PDF + JSON Build Process ===")
 
-        # Build PDF
+        # Build PDF (checks for lualatex unless the cache has the outputs)
         if not self.build_pdf(tex_file, clean_first):
             return False
 
         # Validate JSON
         json_file = f"{tex_name}-boxes.json"
-        if not self.validate_json(json_file):
-            return False
+        with self.stage("validate-json"):
+            if not self.validate_json(json_file):
+                return False
 
         # Copy to UI if requested
         if copy_to_ui:
-            self.copy_to_ui(tex_name)
+            with self.stage("copy-to-ui"):
+                self.copy_to_ui(tex_name)
 
-        # Create build report
-        report = self.create_build_report(tex_name)
+        # Create build report (its own span lands in the metrics dump only)
+        with self.stage("build-report"):
+            report = self.create_build_report(tex_name)
 
         self.log("=== Build Process Complete ===")
         self.log(f"PDF: {tex_name}.pdf")
         self.log(f"JSON: {json_file}")
         self.log(f"Coordinates: {report.get('coordinate_count', 'Unknown')} items")
+        for span in self.spans:
+            self.log(f"Stage {span['name']}: {span['wall_s']:.3f}s wall, {span['cpu_s']:.3f}s CPU, "
+                     f"{span['child_cpu_s']:.3f}s child CPU, {span['child_peak_rss_kb']} KB child peak RSS")
 
         return True
 
+    def write_metrics(self, metrics_file, tex_file, success):
+        """Dump stage timings as JSON for offline analysis"""
+        metrics = {
+            "build_time": datetime.now().isoformat(),
+            "tex_file": str(tex_file),
+            "success": success,
+            **self.timings()
+        }
+        with open(metrics_file, 'w') as f:
+            json.dump(metrics, f, indent=2)
+        self.log(f"Metrics saved: {metrics_file}")
+
+def available_cores():
+    """Number of CPU cores this process may run on"""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def expand_tex_files(patterns, tex_dir):
+    """Expand file names and glob patterns (relative to tex_dir or absolute) into TeX files"""
+    tex_dir = Path(tex_dir)
+    tex_files = []
+    for pattern in patterns:
+        if not any(c in pattern for c in "*?["):
+            matches = [tex_dir / pattern]
+        elif Path(pattern).is_absolute():
+            # Path.glob only takes relative patterns
+            matches = sorted(Path(match) for match in glob.glob(pattern, recursive=True))
+        else:
+            matches = sorted(tex_dir.glob(pattern))
+        for match in matches:
+            try:
+                tex_file = str(match.relative_to(tex_dir))
+            except ValueError:
+                try:
+                    tex_file = str(match.resolve().relative_to(tex_dir.resolve()))
+                except ValueError:
+                    # Not under tex_dir; lualatex still runs there, so keep it absolute
+                    tex_file = str(match.resolve())
+            if tex_file not in tex_files:
+                tex_files.append(tex_file)
+    return tex_files
+
+def run_build_job(job):
+    """Build one TeX file in its own output directory, retrying on failure.
+
+    Runs in a worker process; returns a JSON-serialisable job result.
+    """
+    started = time.monotonic()
+    attempts = []
+
+    for attempt in range(1, job["retries"] + 2):
+        builder = PDFJSONBuilder(job["tex_dir"], output_dir=job["output_dir"],
+                                 timeout=job["timeout"], echo=False,
+                                 use_cache=job["use_cache"], max_runs=job["max_runs"])
+        attempt_started = time.monotonic()
+        try:
+            success = builder.build_all(job["tex_file"], copy_to_ui=False,
+                                        clean_first=job["clean_first"] or attempt > 1)
+        except Exception as e:
+            builder.log(f"Unexpected error: {e}", "ERROR")
+            success = False
+
+        attempts.append({
+            "attempt": attempt,
+            "success": success,
+            "duration_s": round(time.monotonic() - attempt_started, 3),
+            "errors": [entry for entry in builder.build_log if "ERROR:" in entry],
+            "stages": builder.spans
+        })
+        if success:
+            break
+
+    return {
+        "tex_file": job["tex_file"],
+        "output_dir": job["output_dir"],
+        "success": success,
+        "attempts": attempts,
+        "duration_s": round(time.monotonic() - started, 3)
+    }
+
+def build_batch(tex_files, tex_dir="TeX", batch_dir=None, jobs=None, timeout=None,
+                retries=0, clean_first=True, use_cache=True,
+                max_runs=MAX_LATEX_RUNS, metrics_file=None):
+    """Build many TeX files through a process pool and write an aggregate report.
+
+    Each job gets its own output directory under batch_dir, so aux files and
+    clean_build_files calls of concurrent builds never touch each other.
+    Outputs are not copied to the UI directory: jobs with the same file name
+    would overwrite each other there.
+    """
+    if jobs is not None and jobs < 1:
+        raise ValueError(f"jobs must be at least 1, got {jobs}")
+    tex_dir = Path(tex_dir)
+    batch_dir = Path(batch_dir) if batch_dir else tex_dir / "batch-build"
+    batch_dir.mkdir(parents=True, exist_ok=True)
+    jobs = min(jobs or available_cores(), max(len(tex_files), 1))
+
+    job_specs = []
+    used_names = set()
+    for tex_file in tex_files:
+        name = Path(tex_file).stem
+        job_name = name
+        suffix = 2
+        while job_name in used_names:
+            job_name = f"{name}-{suffix}"
+            suffix += 1
+        used_names.add(job_name)
+        job_specs.append({
+            "tex_file": tex_file,
+            "tex_dir": str(tex_dir),
+            "output_dir": str(batch_dir / job_name),
+            "timeout": timeout,
+            "retries": retries,
+            "clean_first": clean_first,
+            "use_cache": use_cache,
+            "max_runs": max_runs
+        })
+
+    print(f"Building {len(job_specs)} files with {jobs} workers")
+    started = time.monotonic()
+    results = []
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {pool.submit(run_build_job, spec): spec for spec in job_specs}
+        for future in as_completed(futures):
+            spec = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {"tex_file": spec["tex_file"], "output_dir": spec["output_dir"],
+                          "success": False, "attempts": [], "duration_s": 0, "error": str(e)}
+            status = "OK" if result["success"] else "FAILED"
+            print(f"[{status}] {result['tex_file']} ({result['duration_s']}s, "
+                  f"{len(result['attempts'])} attempt(s))")
+            results.append(result)
+
+    wall_time = time.monotonic() - started
+    results.sort(key=lambda r: r["tex_file"])
+    succeeded = sum(1 for r in results if r["success"])
+    job_time = sum(r["duration_s"] for r in results)
+    report = {
+        "build_time": datetime.now().isoformat(),
+        "workers": jobs,
+        "total": len(results),
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "retried": sum(1 for r in results if len(r["attempts"]) > 1),
+        "wall_time_s": round(wall_time, 3),
+        "job_time_s": round(job_time, 3),
+        "speedup": round(job_time / wall_time, 2) if wall_time > 0 else None,
+        "jobs": results
+    }
+
+    if metrics_file:
+        write_batch_metrics(metrics_file, report)
+
+    report_path = batch_dir / "batch-report.json"
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"Batch complete: {succeeded}/{len(results)} succeeded in {wall_time:.1f}s")
+    print(f"Batch report saved: {report_path}")
+    return report
+
+def write_batch_metrics(metrics_file, report):
+    """Dump per-stage totals across all jobs of a batch (last attempt of each job)"""
+    stages = {}
+    for job in report["jobs"]:
+        if not job["attempts"]:
+            continue
+        for span in job["attempts"][-1]["stages"]:
+            totals = stages.setdefault(span["name"], {
+                "count": 0, "wall_s": 0.0, "cpu_s": 0.0, "child_cpu_s": 0.0, "child_peak_rss_kb": 0
+            })
+            totals["count"] += 1
+            totals["wall_s"] += span["wall_s"]
+            totals["cpu_s"] += span["cpu_s"]
+            totals["child_cpu_s"] += span["child_cpu_s"]
+            totals["child_peak_rss_kb"] = max(totals["child_peak_rss_kb"], span["child_peak_rss_kb"])
+
+    for totals in stages.values():
+        for key in ("wall_s", "cpu_s", "child_cpu_s"):
+            totals[key] = round(totals[key], 3)
+
+    metrics = {
+        "build_time": report["build_time"],
+        "workers": report["workers"],
+        "wall_time_s": report["wall_time_s"],
+        "stages": stages
+    }
+    with open(metrics_file, 'w') as f:
+        json.dump(metrics, f, indent=2)
+    print(f"Metrics saved: {metrics_file}")
+
 def main():
     parser = argparse.ArgumentParser(description="Build PDF and JSON coordinates")
-    parser.add_argument("tex_file", nargs="?", default="MultiColumn-CS-working-marked.tex",
-                       help="LaTeX file to build (default: MultiColumn-CS-working-marked.tex)")
+    parser.add_argument("tex_files", nargs="*", default=["MultiColumn-CS-working-marked.tex"],
+                       help="LaTeX files or glob patterns to build (default: MultiColumn-CS-working-marked.tex)")
     parser.add_argument("--no-copy", action="store_true",
-                       help="Don't copy files to UI directory")
+                       help="Don't copy files to UI directory (batch builds never copy)")
     parser.add_argument("--no-clean", action="store_true",
                        help="Don't clean build files first")
     parser.add_argument("--tex-dir", default="TeX",
                        help="Directory containing TeX files (default: TeX)")
+    parser.add_argument("--no-cache", action="store_true",
+                       help="Always run LaTeX instead of restoring cached outputs")
+    parser.add_argument("--max-runs", type=int, default=MAX_LATEX_RUNS,
+                       help=f"Maximum LaTeX passes per build (default: {MAX_LATEX_RUNS})")
+    parser.add_argument("--metrics", default=None,
+                       help="Write per-stage timing metrics to this JSON file")
+    parser.add_argument("--batch", action="store_true",
+                       help="Use batch mode even for a single file")
+    parser.add_argument("--jobs", type=int, default=None,
+                       help="Parallel builds in batch mode (default: available cores)")
+    parser.add_argument("--timeout", type=float, default=None,
+                       help="Per-job timeout in seconds for batch mode")
+    parser.add_argument("--retries", type=int, default=1,
+                       help="Retries for a failed job in batch mode (default: 1)")
+    parser.add_argument("--batch-dir", default=None,
+                       help="Output directory for batch jobs (default: <tex-dir>/batch-build)")
 
     args = parser.parse_args()
+    if args.jobs is not None and args.jobs < 1:
+        parser.error("--jobs must be at least 1")
 
     # Change to script directory
     script_dir = Path(__file__).parent
     os.chdir(script_dir)
 
-    builder = PDFJSONBuilder(args.tex_dir)
+    tex_files = expand_tex_files(args.tex_files, args.tex_dir)
+    if not tex_files:
+        print(f"No TeX files matched: {' '.join(args.tex_files)}")
+        sys.exit(1)
+
+    globbed = any(c in pattern for pattern in args.tex_files for c in "*?[")
+    if args.batch or globbed or len(tex_files) > 1:
+        report = build_batch(
+            tex_files,
+            tex_dir=args.tex_dir,
+            batch_dir=args.batch_dir,
+            jobs=args.jobs,
+            timeout=args.timeout,
+            retries=args.retries,
+            clean_first=not args.no_clean,
+            use_cache=not args.no_cache,
+            max_runs=args.max_runs,
+            metrics_file=args.metrics
+        )
+        sys.exit(0 if report["failed"] == 0 else 1)
+
+    builder = PDFJSONBuilder(args.tex_dir, use_cache=not args.no_cache, max_runs=args.max_runs)
 
     success = builder.build_all(
-        args.tex_file,
+        tex_files[0],
         copy_to_ui=not args.no_copy,
-        clean_first=not args.no_clean
+        clean_first=not args.no_clean,
+        metrics_file=args.metrics
     )
 
     sys.exit(0 if success else 1)
@@ -3,20 +3,33 @@
 Convert TeX position ndjson file to marked-boxes.json format
 """
 
+import argparse
+import heapq
 import json
+import os
 import sys
+import tempfile
 from pathlib import Path
-from collections import defaultdict
 
-def parse_ndjson(file_path):
-    """Parse ndjson file and return list of position records"""
-    records = []
+from marked_boxes_binary import MarkedBoxesWriter, binary_path_for
+
+# Key carrying unrounded [x, y, w, h] pt values for the binary sidecar; never written to JSON
+RAW_KEY = '_raw_pt'
+
+# Number of finished boxes sorted in memory before spilling a sorted run to disk
+SPILL_CHUNK_SIZE = 50000
+
+def iter_ndjson(file_path):
+    """Yield position records from an ndjson file one line at a time"""
     with open(file_path, 'r') as f:
         for line in f:
             line = line.strip()
             if line:
-                records.append(json.loads(line))
-    return records
+                yield json.loads(line)
+
+def parse_ndjson(file_path):
+    """Parse ndjson file and return list of position records"""
+    return list(iter_ndjson(file_path))
 
 def sp_to_pt(sp_value):
     """Convert scaled points to points (1 pt = 65536 sp)"""
@@ -30,29 +43,139 @@ def pt_to_px(pt_value, dpi=72):
     """Convert points to pixels (default 72 DPI, 1 pt = 1 px at 72 DPI)"""
     return pt_value * (dpi / 72.0)
 
-def group_records_by_id(records):
-    """Group start/end records by ID and page (to handle figures appearing on multiple pages)"""
-    grouped = defaultdict(list)
-    seen_records = set()  # Track unique (id, page, role) to avoid duplicates
-    
+def pair_records(records, page_sources=None, dpi=72, keep_raw=False):
+    """Pair start/end records by ID and page as they arrive and yield bounding boxes.
+
+    Only records still waiting for their partner are held in memory, so peak
+    memory depends on the number of open elements, not on file size. An end
+    record that arrives before its start is kept until the start shows up.
+    Page source counts are accumulated into ``page_sources`` in the same pass.
+    With ``keep_raw`` each box also carries its unrounded pt values under RAW_KEY.
+    """
+    open_starts = {}
+    open_ends = {}
+
     for record in records:
-        # Create a unique key for deduplication (id, page, role)
-        dedup_key = (record['id'], record['page'], record['role'])
-        
-        # Skip if we've already seen this exact record
-        if dedup_key in seen_records:
-            print(f"Info: Skipping duplicate record for {record['id']} on page {record['page']} (role: {record['role']})")
-            continue
-        
-        seen_records.add(dedup_key)
-        
+        if page_sources is not None:
+            source = record.get('page_source', 'unknown')
+            page_sources[source] = page_sources.get(source, 0) + 1
+
         # Group by both ID and page to handle same figure on different pages
         key = (record['id'], record['page'])
-        grouped[key].append(record)
+        role = record['role']
+
+        if role.endswith('-start'):
+            if key in open_starts:
+                print(f"Info: Skipping duplicate record for {record['id']} on page {record['page']} (role: {role})")
+                continue
+            end_record = open_ends.pop(key, None)
+            if end_record is None:
+                open_starts[key] = record
+                continue
+            start_record = record
+        elif role.endswith('-end'):
+            if key in open_ends:
+                print(f"Info: Skipping duplicate record for {record['id']} on page {record['page']} (role: {role})")
+                continue
+            start_record = open_starts.pop(key, None)
+            if start_record is None:
+                # Start still to come, or on another page
+                open_ends[key] = record
+                continue
+            end_record = record
+        else:
+            continue
+
+        bbox = calculate_bounding_box([start_record, end_record], dpi, keep_raw)
+        if bbox:
+            yield bbox
+        else:
+            print(f"Skipping {record['id']} (page {record['page']}) due to calculation error")
+
+    for item_id, page_num in open_starts:
+        print(f"Warning: Missing end record for {item_id} (page {page_num})")
+    for item_id, page_num in open_ends:
+        print(f"Warning: Missing start record for {item_id} (page {page_num})")
+
+def _box_sort_key(box):
+    return (box['page'], box['id'])
+
+def _spill_run(boxes, spill_dir):
+    """Sort a chunk of boxes and write it to a temporary run file"""
+    boxes.sort(key=_box_sort_key)
+    run = tempfile.NamedTemporaryFile('w', dir=spill_dir, suffix='.ndjson', delete=False)
+    with run:
+        for box in boxes:
+            run.write(json.dumps(box))
+            run.write('\n')
+    return run.name
+
+def sort_boxes(boxes, chunk_size=SPILL_CHUNK_SIZE, spill_dir=None):
+    """Yield boxes sorted by (page, id), spilling sorted runs to disk past ``chunk_size``.
+
+    Small documents are sorted entirely in memory; larger ones are merged from
+    temporary run files so memory stays bounded by ``chunk_size``. Boxes with
+    the same (page, id) come out in arrival order.
+    """
+    chunk = []
+    run_files = []
+    try:
+        for box in boxes:
+            chunk.append(box)
+            if len(chunk) >= chunk_size:
+                run_files.append(_spill_run(chunk, spill_dir))
+                chunk = []
+
+        if not run_files:
+            chunk.sort(key=_box_sort_key)
+            yield from chunk
+            return
+
+        if chunk:
+            run_files.append(_spill_run(chunk, spill_dir))
+            chunk = []
+
+        runs = [iter_ndjson(run_file) for run_file in run_files]
+        yield from heapq.merge(*runs, key=_box_sort_key)
+    finally:
+        for run_file in run_files:
+            Path(run_file).unlink(missing_ok=True)
+
+def partial_path_for(output_file):
+    """Hidden temporary path next to output_file, for writes that must not truncate it"""
+    output_path = Path(output_file)
+    return output_path.with_name(f".{output_path.name}.{os.getpid()}.tmp")
+
+def write_json_array(items, f):
+    """Stream items to ``f`` formatted exactly like ``json.dump(items, f, indent=2)``"""
+    first = True
+    for item in items:
+        f.write('[\n  ' if first else ',\n  ')
+        f.write(json.dumps(item, indent=2).replace('\n', '\n  '))
+        first = False
+    f.write('[]' if first else '\n]')
+
+def check_pair(start_record, end_record):
+    """Warn about page issues for a start/end pair and return the start page source"""
+    # Check for page number consistency and warn about potential issues
+    if start_record['page'] != end_record['page']:
+        print(f"Warning: {start_record['id']} spans multiple pages ({start_record['page']} to {end_record['page']})")
+    
+    # Check page source for accuracy info
+    start_source = start_record.get('page_source', 'unknown')
+    end_source = end_record.get('page_source', 'unknown')
     
-    return grouped
+    if start_source == 'zref' and end_source == 'zref':
+        # Good! Using zref means accurate page numbers
+        pass
+    elif start_source == 'counter' or end_source == 'counter':
+        print(f"Warning: {start_record['id']} uses page counter (may be inaccurate for floats) - run LaTeX 3x with zref-savepos")
+    elif start_source == 'counter-fallback' or end_source == 'counter-fallback':
+        print(f"Warning: {start_record['id']} fell back to page counter - consider running LaTeX again")
+    
+    return start_source
 
-def calculate_bounding_box(records):
+def calculate_bounding_box(records, dpi=72, keep_raw=False):
     """Calculate bounding box from start/end records"""
     if len(records) != 2:
         print(f"Warning: Expected 2 records (start/end), got {len(records)} for ID")
@@ -72,21 +195,7 @@ def calculate_bounding_box(records):
         print(f"Warning: Missing start or end record")
         return None
     
-    # Check for page number consistency and warn about potential issues
-    if start_record['page'] != end_record['page']:
-        print(f"Warning: {start_record['id']} spans multiple pages ({start_record['page']} to {end_record['page']})")
-    
-    # Check page source for accuracy info
-    start_source = start_record.get('page_source', 'unknown')
-    end_source = end_record.get('page_source', 'unknown')
-    
-    if start_source == 'zref' and end_source == 'zref':
-        # Good! Using zref means accurate page numbers
-        pass
-    elif start_source == 'counter' or end_source == 'counter':
-        print(f"Warning: {start_record['id']} uses page counter (may be inaccurate for floats) - run LaTeX 3x with zref-savepos")
-    elif start_source == 'counter-fallback' or end_source == 'counter-fallback':
-        print(f"Warning: {start_record['id']} fell back to page counter - consider running LaTeX again")
+    start_source = check_pair(start_record, end_record)
     
     # Convert coordinates from sp to pt
     x1_pt = sp_to_pt(start_record['xsp'])
@@ -115,12 +224,12 @@ def calculate_bounding_box(records):
     w_mm = pt_to_mm(w_pt)
     h_mm = pt_to_mm(h_pt)
     
-    x_px = pt_to_px(x_pt)
-    y_px = pt_to_px(y_pt)
-    w_px = pt_to_px(w_pt)
-    h_px = pt_to_px(h_pt)
+    x_px = pt_to_px(x_pt, dpi)
+    y_px = pt_to_px(y_pt, dpi)
+    w_px = pt_to_px(w_pt, dpi)
+    h_px = pt_to_px(h_pt, dpi)
     
-    return {
+    box = {
         'id': start_record['id'],
         'page': start_record['page'],
         'page_source': start_source,
@@ -137,20 +246,73 @@ def calculate_bounding_box(records):
         'w_px': round(w_px, 2),
         'h_px': round(h_px, 2)
     }
+    if keep_raw:
+        box[RAW_KEY] = [x_pt, y_pt, w_pt, h_pt]
+    return box
+
+def convert_ndjson_to_marked_boxes(input_file, output_file=None, chunk_size=SPILL_CHUNK_SIZE, dpi=72,
+                                   write_binary=True):
+    """Convert ndjson file to marked-boxes.json format in a single streaming pass
 
-def convert_ndjson_to_marked_boxes(input_file, output_file=None):
-    """Convert ndjson file to marked-boxes.json format"""
+    Unless ``write_binary`` is False, the same boxes are also written to the
+    compact .mbx sidecar (see marked_boxes_binary.py) next to the JSON.
+    """
     
-    # Parse the ndjson file
-    records = parse_ndjson(input_file)
-    print(f"Parsed {len(records)} records from {input_file}")
+    # Determine output file
+    if output_file is None:
+        input_path = Path(input_file)
+        output_file = input_path.parent / f"{input_path.stem}-marked-boxes.json"
     
-    # Analyze page source accuracy
     page_sources = {}
-    for record in records:
-        source = record.get('page_source', 'unknown')
-        page_sources[source] = page_sources.get(source, 0) + 1
+    page_summary = {}
+    box_count = 0
+    binary_writer = MarkedBoxesWriter(binary_path_for(output_file), dpi, json_file=output_file) if write_binary else None
+    
+    def summarize(boxes):
+        nonlocal box_count
+        previous_key = None
+        for box in boxes:
+            # Records repeated after their pair was closed produce the same
+            # (page, id) again; sorting makes them adjacent, keep the first
+            key = _box_sort_key(box)
+            if key == previous_key:
+                print(f"Info: Skipping duplicate box for {box['id']} on page {box['page']}")
+                continue
+            previous_key = key
+            
+            raw = box.pop(RAW_KEY, None)
+            if binary_writer is not None:
+                binary_writer.write(box['id'], box['page'], box['page_source'], *raw)
+            
+            box_count += 1
+            page = box['page']
+            source = box.get('page_source', 'unknown')
+            if page not in page_summary:
+                page_summary[page] = {'total': 0, 'sources': {}}
+            page_summary[page]['total'] += 1
+            page_summary[page]['sources'][source] = page_summary[page]['sources'].get(source, 0) + 1
+            yield box
+    
+    # Pair, sort and write the result in one pass over the input; the JSON
+    # and its sidecar only replace existing files once the whole input has
+    # been converted, and a failed conversion leaves neither behind
+    boxes = pair_records(iter_ndjson(input_file), page_sources, dpi, keep_raw=write_binary)
+    temp_file = partial_path_for(output_file)
+    try:
+        with open(temp_file, 'w') as f:
+            write_json_array(summarize(sort_boxes(boxes, chunk_size)), f)
+        os.replace(temp_file, output_file)
+    except BaseException:
+        temp_file.unlink(missing_ok=True)
+        if binary_writer is not None:
+            binary_writer.abort()
+        raise
+    if binary_writer is not None:
+        binary_writer.close()
+    
+    print(f"Parsed {sum(page_sources.values())} records from {input_file}")
     
+    # Analyze page source accuracy
     print("\nPage number source analysis:")
     for source, count in page_sources.items():
         print(f"  {source}: {count} records")
@@ -160,44 +322,10 @@ def convert_ndjson_to_marked_boxes(input_file, output_file=None):
         print("   For floats, this may result in incorrect page numbers.")
         print("   Recommendation: Run LaTeX 2-3 times to stabilize page references.")
     
-    # Group records by ID and page
-    grouped_records = group_records_by_id(records)
-    print(f"\nFound {len(grouped_records)} unique ID-page combinations")
-    
-    # Convert to marked boxes format
-    marked_boxes = []
-    
-    for (item_id, page_num), item_records in grouped_records.items():
-        bbox = calculate_bounding_box(item_records)
-        if bbox:
-            marked_boxes.append(bbox)
-        else:
-            print(f"Skipping {item_id} (page {page_num}) due to calculation error")
-    
-    # Sort by page and then by ID for consistent output
-    marked_boxes.sort(key=lambda x: (x['page'], x['id']))
-    
-    # Determine output file
-    if output_file is None:
-        input_path = Path(input_file)
-        output_file = input_path.parent / f"{input_path.stem}-marked-boxes.json"
-    
-    # Write the result
-    with open(output_file, 'w') as f:
-        json.dump(marked_boxes, f, indent=2)
-    
     print(f"\nConverted to {output_file}")
-    print(f"Generated {len(marked_boxes)} marked boxes")
-    
-    # Generate summary by page
-    page_summary = {}
-    for box in marked_boxes:
-        page = box['page']
-        source = box.get('page_source', 'unknown')
-        if page not in page_summary:
-            page_summary[page] = {'total': 0, 'sources': {}}
-        page_summary[page]['total'] += 1
-        page_summary[page]['sources'][source] = page_summary[page]['sources'].get(source, 0) + 1
+    if binary_writer is not None:
+        print(f"Binary sidecar: {binary_writer.path}")
+    print(f"Generated {box_count} marked boxes")
     
     print(f"\nPage summary:")
     for page in sorted(page_summary.keys()):
@@ -209,20 +337,32 @@ def convert_ndjson_to_marked_boxes(input_file, output_file=None):
     return output_file
 
 def main():
-    if len(sys.argv) < 2:
-        print("Usage: python convert_ndjson_to_marked_boxes.py <input.ndjson> [output.json]")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Convert TeX position ndjson file to marked-boxes.json format")
+    parser.add_argument("input_file", help="Path to the -texpos.ndjson file")
+    parser.add_argument("output_file", nargs="?", default=None,
+                       help="Output JSON file (default: <input>-marked-boxes.json)")
+    parser.add_argument("--dpi", type=float, default=72,
+                       help="Resolution used for the *_px columns (default: 72, 1 px per pt)")
+    parser.add_argument("--no-binary", action="store_true",
+                       help="Don't write the compact .mbx sidecar next to the JSON")
+    parser.add_argument("--index", action="store_true",
+                       help="Also write the spatial index sidecar (.idx) used by box_index.py")
     
-    input_file = sys.argv[1]
-    output_file = sys.argv[2] if len(sys.argv) > 2 else None
+    args = parser.parse_args()
+    input_file = args.input_file
     
     if not Path(input_file).exists():
         print(f"Error: Input file {input_file} does not exist")
         sys.exit(1)
     
     try:
-        result_file = convert_ndjson_to_marked_boxes(input_file, output_file)
+        result_file = convert_ndjson_to_marked_boxes(input_file, args.output_file, dpi=args.dpi,
+                                                     write_binary=not args.no_binary)
         print(f"Success! Converted {input_file} to {result_file}")
+        if args.index:
+            from box_index import build_index_file
+            index_file, index = build_index_file(result_file)
+            print(f"Indexed {len(index)} boxes on {len(index.pages)} pages: {index_file}")
     except Exception as e:
         print(f"Error: {e}")
         sys.exit(1)
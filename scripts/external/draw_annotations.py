@@ -0,0 +1,196 @@
+import argparse
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from PIL import Image, ImageColor, ImageDraw
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+
+# Page size used when a record has no pw/ph (A4 as emitted by geom-marks.tex)
+DEFAULT_PAGE_WIDTH_PT = 597.50787
+DEFAULT_PAGE_HEIGHT_PT = 845.04684
+
+def parse_dimension(value, default):
+    """Parse a TeX dimension such as '597.50787pt' into points"""
+    if value is None:
+        return default
+    return float(str(value).replace('pt', ''))
+
+def load_pages(ndjson_path):
+    """
+    Parse the NDJSON file once and group it by page.
+
+    Returns {page: {'marks': [(x_sp, y_sp, pw, ph)], 'boxes': {id: {'start'|'end': (x_sp, y_sp, cw_sp, pw, ph)}}}}
+    """
+    pages = {}
+    with open(ndjson_path, 'r') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                data = json.loads(line)
+                page = data.get('page')
+                x_sp = float(data.get('xsp'))
+                y_sp = float(data.get('ysp'))
+                pw = parse_dimension(data.get('pw'), DEFAULT_PAGE_WIDTH_PT)
+                ph = parse_dimension(data.get('ph'), DEFAULT_PAGE_HEIGHT_PT)
+            except (json.JSONDecodeError, TypeError, ValueError) as e:
+                logging.warning(f"Skipping malformed line: {line.strip()} ({e})")
+                continue
+
+            if page is None:
+                logging.warning(f"Skipping malformed line: {line.strip()}")
+                continue
+
+            entry = pages.setdefault(page, {'marks': [], 'boxes': {}})
+            entry['marks'].append((x_sp, y_sp, pw, ph))
+
+            element_id = data.get('id')
+            role = data.get('role')
+            cw_sp = data.get('cwsp')
+            if element_id and role and cw_sp is not None:
+                role_type = role.split('-')[-1]
+                if role_type in ['start', 'end']:
+                    entry['boxes'].setdefault(element_id, {})[role_type] = (x_sp, y_sp, float(cw_sp), pw, ph)
+
+    return pages
+
+def find_page_image(img_prefix, page):
+    """Locate the page image, accepting both zero-padded and plain page numbers"""
+    for candidate in (Path(f"{img_prefix}-{page:02}.png"), Path(f"{img_prefix}-{page}.png")):
+        if candidate.exists():
+            return candidate
+    return None
+
+def draw_page(draw, size, entry, options):
+    """Draw the boxes and marks of one page onto an ImageDraw canvas"""
+    img_width, img_height = size
+
+    if options['boxes']:
+        for roles in entry['boxes'].values():
+            if 'start' not in roles or 'end' not in roles:
+                continue
+            start_x_sp, start_y_sp, cw_sp, pw, ph = roles['start']
+            end_y_sp = roles['end'][1]
+
+            x1_px = (start_x_sp / 65536) * (img_width / pw)
+            x2_px = ((start_x_sp + cw_sp) / 65536) * (img_width / pw)
+            y1_px = img_height - (start_y_sp / 65536) * (img_height / ph)
+            y2_px = img_height - (end_y_sp / 65536) * (img_height / ph)
+
+            draw.rectangle(
+                [(min(x1_px, x2_px), min(y1_px, y2_px)), (max(x1_px, x2_px), max(y1_px, y2_px))],
+                outline=options['box_color'],
+                width=options['thickness']
+            )
+
+    if options['marks']:
+        radius = options['radius']
+        for x_sp, y_sp, pw, ph in entry['marks']:
+            x_px = (x_sp / 65536) * (img_width / pw)
+            y_px = img_height - (y_sp / 65536) * (img_height / ph)
+            draw.ellipse(
+                [(x_px - radius, y_px - radius), (x_px + radius, y_px + radius)],
+                outline=options['mark_color'],
+                width=options['thickness']
+            )
+
+def render_page(job):
+    """Render one page; runs in a worker process and returns the output path"""
+    img_path, output_path, entry, options = job
+
+    with Image.open(img_path) as img:
+        if options['overlay']:
+            # Only the header is read; the page pixels are never decoded.
+            # A paletted layer (index 0 transparent) is a quarter the size
+            # of RGBA and much faster to encode.
+            canvas = Image.new("P", img.size, 0)
+            palette = [0, 0, 0]
+            palette += ImageColor.getrgb(options['box_color'])[:3]
+            palette += ImageColor.getrgb(options['mark_color'])[:3]
+            canvas.putpalette(palette)
+            draw_page(ImageDraw.Draw(canvas), canvas.size, entry,
+                      dict(options, box_color=1, mark_color=2))
+            canvas.save(output_path, transparency=0, compress_level=1)
+        else:
+            canvas = img if img.mode in ("RGB", "RGBA") else img.convert("RGB")
+            canvas.load()
+            draw_page(ImageDraw.Draw(canvas), canvas.size, entry, options)
+            # Proof images are throwaway; favour encode speed over file size
+            canvas.save(output_path, compress_level=1)
+
+    return str(output_path)
+
+def render_annotations(ndjson_path, img_prefix, output_dir, boxes=True, marks=True,
+                       box_color="blue", mark_color="red", radius=10, thickness=2,
+                       overlay=False, workers=None, suffix=None):
+    """
+    Parse an NDJSON file once and annotate every page image with boxes and/or marks.
+
+    With overlay=True only transparent layers with the annotations are written,
+    so the page images are never decoded or re-encoded.
+
+    Usage example:
+    python draw_annotations.py document-generated-texpos.ndjson document-images --output-dir annotated
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    suffix = suffix or ("overlay" if overlay else "annotated")
+
+    options = {
+        'boxes': boxes,
+        'marks': marks,
+        'box_color': box_color,
+        'mark_color': mark_color,
+        'radius': radius,
+        'thickness': thickness,
+        'overlay': overlay,
+    }
+
+    jobs = []
+    for page, entry in sorted(load_pages(ndjson_path).items()):
+        img_path = find_page_image(img_prefix, page)
+        if img_path is None:
+            logging.warning(f"Image not found for page {page}: {img_prefix}-{page}.png")
+            continue
+        output_path = output_dir / f"{img_path.stem}-{suffix}.png"
+        jobs.append((img_path, output_path, entry, options))
+
+    workers = min(workers or os.cpu_count() or 1, max(len(jobs), 1))
+    if workers == 1:
+        results = map(render_page, jobs)
+        for output_path in results:
+            logging.info(f"Saved annotated image: {output_path}")
+        return len(jobs)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for output_path in pool.map(render_page, jobs, chunksize=max(1, len(jobs) // (workers * 4))):
+            logging.info(f"Saved annotated image: {output_path}")
+    return len(jobs)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Draw bounding boxes and coordinate marks from an NDJSON file onto page images.")
+    parser.add_argument("ndjson_path", type=Path, help="Path to the NDJSON file")
+    parser.add_argument("img_prefix", type=str, help="Prefix for the image files (e.g., 'document-images')")
+    parser.add_argument("--output-dir", type=Path, default=Path("annotated"), help="Output directory for annotated images")
+    parser.add_argument("--no-boxes", action="store_true", help="Don't draw bounding boxes")
+    parser.add_argument("--no-marks", action="store_true", help="Don't draw coordinate marks")
+    parser.add_argument("--box-color", type=str, default="blue", help="Color of the bounding boxes")
+    parser.add_argument("--mark-color", type=str, default="red", help="Color of the mark circles")
+    parser.add_argument("--radius", type=int, default=10, help="Radius of the mark circles")
+    parser.add_argument("--thickness", type=int, default=2, help="Outline thickness")
+    parser.add_argument("--overlay", action="store_true", help="Write transparent annotation layers instead of annotated page copies")
+    parser.add_argument("--workers", type=int, default=None, help="Parallel render processes (default: CPU count)")
+
+    args = parser.parse_args()
+
+    render_annotations(
+        args.ndjson_path, args.img_prefix, args.output_dir,
+        boxes=not args.no_boxes, marks=not args.no_marks,
+        box_color=args.box_color, mark_color=args.mark_color,
+        radius=args.radius, thickness=args.thickness,
+        overlay=args.overlay, workers=args.workers
+    )
@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""
+Compact binary format for marked boxes
+
+Each box is a fixed-width little-endian record holding its page, page source
+and the unrounded x/y/w/h in points; ids live in a separate string table.
+The mm and px values of the JSON are derived on demand, so a .mbx file is a
+fraction of the size of the matching -marked-boxes.json and can be
+memory-mapped instead of parsed. The header records the size and SHA-256 of
+the JSON it was written with, so a sidecar is only used for that exact file.
+
+Layout:
+  header   HEADER (padded to HEADER_SIZE bytes)
+  records  RECORD_STRUCT x box count
+  ids      UTF-8 id strings, addressed by (id_offset, id_length)
+  sources  page source names joined with newlines
+
+Usage:
+  python3 marked_boxes_binary.py document-marked-boxes.json   # convert
+  python3 marked_boxes_binary.py document-marked-boxes.mbx    # summary
+"""
+
+import hashlib
+import json
+import itertools
+import os
+import shutil
+import struct
+import sys
+import tempfile
+from pathlib import Path
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - reading then requires NumPy
+    np = None
+
+BINARY_MAGIC = b"MBOX"
+BINARY_VERSION = 2
+
+# magic, version, box count, record size, id bytes, source bytes, dpi,
+# JSON size, JSON SHA-256
+HEADER = struct.Struct("<4sIIIIIdQ32s")
+HEADER_SIZE = 80
+
+# page, id offset, id length, source index, padding, x/y/w/h in pt
+RECORD_STRUCT = struct.Struct("<iIIB3xdddd")
+
+if np is not None:
+    RECORD_DTYPE = np.dtype([
+        ("page", "<i4"),
+        ("id_offset", "<u4"),
+        ("id_length", "<u4"),
+        ("source", "u1"),
+        ("_pad", "V3"),
+        ("x_pt", "<f8"),
+        ("y_pt", "<f8"),
+        ("w_pt", "<f8"),
+        ("h_pt", "<f8"),
+    ])
+    assert RECORD_DTYPE.itemsize == RECORD_STRUCT.size
+
+PT_TO_MM = 0.352778
+COORD_NAMES = ("x", "y", "w", "h")
+
+def binary_path_for(json_file):
+    """Sidecar path next to a marked-boxes JSON file"""
+    return Path(json_file).with_suffix(".mbx")
+
+def json_fingerprint(json_file):
+    """(size, SHA-256 digest) of a JSON file, or (0, empty digest) if missing"""
+    json_file = Path(json_file)
+    if not json_file.exists():
+        return 0, bytes(32)
+    digest = hashlib.sha256()
+    with open(json_file, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return json_file.stat().st_size, digest.digest()
+
+class MarkedBoxesWriter:
+    """Stream boxes into a .mbx file; ids are spooled so memory stays flat
+
+    The file is written under a temporary name and only replaces ``path`` in
+    close(), which also fingerprints ``json_file`` (the JSON the boxes came
+    from, written by then). abort() discards everything written so far.
+    """
+
+    def __init__(self, path, dpi=72, json_file=None):
+        self.path = Path(path)
+        self.dpi = float(dpi)
+        self.json_file = json_file
+        self.count = 0
+        self.sources = {}
+        self._id_bytes = 0
+        self._temp_path = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        self._file = open(self._temp_path, "wb")
+        self._file.write(b"\0" * HEADER_SIZE)
+        self._ids = tempfile.TemporaryFile()
+
+    def write(self, box_id, page, source, x_pt, y_pt, w_pt, h_pt):
+        encoded = str(box_id).encode("utf-8")
+        source_index = self.sources.setdefault(source, len(self.sources))
+        self._file.write(RECORD_STRUCT.pack(
+            int(page), self._id_bytes, len(encoded), source_index,
+            x_pt, y_pt, w_pt, h_pt
+        ))
+        self._ids.write(encoded)
+        self._id_bytes += len(encoded)
+        self.count += 1
+
+    def close(self):
+        json_size, json_digest = (0, bytes(32)) if self.json_file is None else json_fingerprint(self.json_file)
+        try:
+            self._ids.seek(0)
+            shutil.copyfileobj(self._ids, self._file)
+            source_table = "\n".join(self.sources).encode("utf-8")
+            self._file.write(source_table)
+            self._file.seek(0)
+            self._file.write(HEADER.pack(
+                BINARY_MAGIC, BINARY_VERSION, self.count, RECORD_STRUCT.size,
+                self._id_bytes, len(source_table), self.dpi, json_size, json_digest
+            ))
+            self._file.close()
+            os.replace(self._temp_path, self.path)
+        except BaseException:
+            self.abort()
+            raise
+        finally:
+            self._ids.close()
+        return self.path
+
+    def abort(self):
+        """Discard the partial file; an existing sidecar at path is left alone"""
+        self._ids.close()
+        self._file.close()
+        self._temp_path.unlink(missing_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+def write_from_json(json_file, binary_file=None, dpi=72):
+    """Convert an existing marked-boxes JSON file (rounded pt values) to .mbx"""
+    binary_file = binary_file or binary_path_for(json_file)
+    with open(json_file, "r") as f:
+        boxes = json.load(f)
+    with MarkedBoxesWriter(binary_file, dpi, json_file=json_file) as writer:
+        for box in boxes:
+            writer.write(box["id"], box["page"], box.get("page_source", "unknown"),
+                         box["x_pt"], box["y_pt"], box["w_pt"], box["h_pt"])
+    return binary_file
+
+class BoxRow:
+    """One box; rounded pt, mm and px values are computed on access"""
+
+    __slots__ = ("_boxes", "_index")
+
+    def __init__(self, boxes, index):
+        self._boxes = boxes
+        self._index = index
+
+    @property
+    def id(self):
+        return self._boxes.id_at(self._index)
+
+    @property
+    def page(self):
+        return int(self._boxes.records["page"][self._index])
+
+    @property
+    def page_source(self):
+        return self._boxes.sources[self._boxes.records["source"][self._index]]
+
+    def raw_pt(self, name):
+        return float(self._boxes.records[f"{name}_pt"][self._index])
+
+    def pt(self, name):
+        return round(self.raw_pt(name), 2)
+
+    def mm(self, name):
+        return round(self.raw_pt(name) * PT_TO_MM, 2)
+
+    def px(self, name):
+        return round(self.raw_pt(name) * (self._boxes.dpi / 72.0), 2)
+
+    def to_dict(self):
+        """The box exactly as it appears in the marked-boxes JSON"""
+        box = {"id": self.id, "page": self.page, "page_source": self.page_source}
+        for unit in ("pt", "mm", "px"):
+            convert = getattr(self, unit)
+            for name in COORD_NAMES:
+                box[f"{name}_{unit}"] = convert(name)
+        return box
+
+    def __getattr__(self, attr):
+        # x_pt, w_mm, h_px, ...
+        name, _, unit = attr.partition("_")
+        if name in COORD_NAMES and unit in ("pt", "mm", "px"):
+            return getattr(self, unit)(name)
+        raise AttributeError(attr)
+
+    def __repr__(self):
+        return f"BoxRow({self.to_dict()!r})"
+
+class MarkedBoxes:
+    """Memory-mapped view of a .mbx file"""
+
+    def __init__(self, path):
+        if np is None:
+            raise ImportError("NumPy is required to read .mbx files")
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            header = f.read(HEADER_SIZE)
+        if len(header) < HEADER_SIZE:
+            raise ValueError(f"{path} is not a version {BINARY_VERSION} marked-boxes file")
+        (magic, version, count, record_size, id_bytes, source_bytes, dpi,
+         json_size, json_digest) = HEADER.unpack_from(header)
+        if magic != BINARY_MAGIC or version != BINARY_VERSION or record_size != RECORD_DTYPE.itemsize:
+            raise ValueError(f"{path} is not a version {BINARY_VERSION} marked-boxes file")
+
+        self.dpi = dpi
+        self.json_size = json_size
+        self.json_digest = json_digest
+        self._map = np.memmap(self.path, dtype=np.uint8, mode="r")
+        records_end = HEADER_SIZE + count * record_size
+        # Zero-copy views into the mapping
+        self.records = self._map[HEADER_SIZE:records_end].view(RECORD_DTYPE)
+        self._id_blob = self._map[records_end:records_end + id_bytes]
+        source_table = bytes(self._map[records_end + id_bytes:records_end + id_bytes + source_bytes])
+        self.sources = source_table.decode("utf-8").split("\n") if source_bytes else []
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return BoxRow(self, index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield BoxRow(self, index)
+
+    def id_at(self, index):
+        start = int(self.records["id_offset"][index])
+        end = start + int(self.records["id_length"][index])
+        return bytes(self._id_blob[start:end]).decode("utf-8")
+
+    def ids(self):
+        """All ids, decoded from the string table in one go"""
+        blob = bytes(self._id_blob)
+        offsets = self.records["id_offset"].tolist()
+        lengths = self.records["id_length"].tolist()
+        return [blob[o:o + n].decode("utf-8") for o, n in zip(offsets, lengths)]
+
+    def column(self, name):
+        """Zero-copy array of a record field (page, x_pt, y_pt, w_pt, h_pt, ...)"""
+        return self.records[name]
+
+    def mm(self, name):
+        """Unrounded millimetre values for x, y, w or h"""
+        return self.records[f"{name}_pt"] * PT_TO_MM
+
+    def px(self, name):
+        """Unrounded pixel values for x, y, w or h at the stored DPI"""
+        return self.records[f"{name}_pt"] * (self.dpi / 72.0)
+
+    def invalid_dimensions(self):
+        """Indices of boxes whose rounded width or height is not positive"""
+        w = self.records["w_pt"]
+        h = self.records["h_pt"]
+        # Same test as `<= 0` on the JSON's values rounded to 2 decimals
+        return np.flatnonzero((w < 0.005) | (h < 0.005))
+
+    def close(self):
+        self.records = None
+        self._id_blob = None
+        self._map = None
+
+def open_fresh(json_file, verify=False):
+    """Open the .mbx next to json_file if it was written with that JSON, else None
+
+    The sidecar must be at least as new as the JSON and record its size; with
+    ``verify`` the JSON's SHA-256 must match too, which proves the JSON is
+    byte for byte the file the boxes were written with.
+    """
+    if np is None:
+        return None
+    json_file = Path(json_file)
+    binary_file = binary_path_for(json_file)
+    if not binary_file.exists() or not json_file.exists():
+        return None
+    if binary_file.stat().st_mtime < json_file.stat().st_mtime:
+        return None
+    try:
+        boxes = MarkedBoxes(binary_file)
+    except ValueError:
+        return None
+    json_size = json_file.stat().st_size
+    if boxes.json_size != json_size or (verify and json_fingerprint(json_file) != (json_size, boxes.json_digest)):
+        boxes.close()
+        return None
+    return boxes
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python3 marked_boxes_binary.py <marked-boxes.json | file.mbx>")
+        sys.exit(1)
+
+    path = Path(sys.argv[1])
+    if not path.exists():
+        print(f"Error: {path} does not exist")
+        sys.exit(1)
+
+    if path.suffix == ".json":
+        binary_file = write_from_json(path)
+        print(f"Wrote {binary_file} ({binary_file.stat().st_size} bytes, "
+              f"JSON {path.stat().st_size} bytes)")
+        return
+
+    boxes = MarkedBoxes(path)
+    pages = np.unique(boxes.column("page"))
+    print(f"{path}: {len(boxes)} boxes on {len(pages)} pages (px at {boxes.dpi:g} DPI)")
+    for row in itertools.islice(boxes, 5):
+        print(f"  {row.to_dict()}")
+
+if __name__ == "__main__":
+    main()
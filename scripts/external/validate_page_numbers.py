@@ -6,46 +6,131 @@ This script helps validate the accuracy of page numbers in the coordinate
 emission system by comparing different sources and identifying potential issues.
 """
 
+import argparse
 import json
+import os
 import sys
 from pathlib import Path
 from collections import defaultdict, Counter
+from concurrent.futures import ProcessPoolExecutor
 
-def analyze_page_sources(ndjson_file):
-    """Analyze page number sources from NDJSON file"""
-    
-    records = []
-    page_source_stats = Counter()
-    page_distribution = defaultdict(lambda: defaultdict(int))
-    
-    print(f"📊 Analyzing page sources in {ndjson_file}")
-    print("=" * 60)
-    
+INACCURATE_SOURCES = ('counter', 'counter-fallback')
+
+# Default coordinate drift (in pt) reported by diff mode
+DEFAULT_DRIFT_THRESHOLD_PT = 0.5
+
+def iter_records(ndjson_file, warnings=None):
+    """Yield (line number, record) for each valid line of an NDJSON file"""
     with open(ndjson_file, 'r') as f:
         for line_num, line in enumerate(f, 1):
             line = line.strip()
             if not line:
                 continue
-                
             try:
-                record = json.loads(line)
-                records.append(record)
-                
-                page = record.get('page', 'unknown')
-                source = record.get('page_source', 'unknown')
-                
-                page_source_stats[source] += 1
-                page_distribution[page][source] += 1
-                
+                yield line_num, json.loads(line)
             except json.JSONDecodeError as e:
-                print(f"⚠️  Warning: Invalid JSON on line {line_num}: {e}")
+                if warnings is not None:
+                    warnings.append(f"Invalid JSON on line {line_num}: {e}")
+
+def validate_file(ndjson_file):
+    """
+    Compute source stats, start/end pairing issues and page spans in one pass.
+
+    Only start records still waiting for their end are kept (page and source);
+    every other element is reduced to a per-ID record count. Returns a
+    JSON-serialisable report.
+    """
+    page_source_stats = Counter()
+    page_distribution = defaultdict(Counter)
+    record_counts = Counter()
+    open_starts = {}
+    open_ends = {}
+    pair_issues = {}
+    spans = []
+    warnings = []
+
+    def close_pair(element_id, start, end):
+        start_page, start_source = start
+        end_page, end_source = end
+        issues = []
+        if start_page != end_page:
+            spans.append({'id': element_id, 'start_page': start_page, 'end_page': end_page})
+        if start_source in INACCURATE_SOURCES or end_source in INACCURATE_SOURCES:
+            issues.append({'id': element_id, 'type': 'counter_source', 'page': start_page})
+        if issues:
+            pair_issues[element_id] = issues
+
+    for _, record in iter_records(ndjson_file, warnings):
+        page = record.get('page', 'unknown')
+        source = record.get('page_source', 'unknown')
+        page_source_stats[source] += 1
+        page_distribution[page][source] += 1
+
+        element_id = record.get('id')
+        role = record.get('role', '')
+        record_counts[element_id] += 1
+        if record_counts[element_id] > 2:
+            continue
+
+        if role.endswith('-start'):
+            if element_id in open_ends:
+                close_pair(element_id, (page, source), open_ends.pop(element_id))
+            else:
+                open_starts[element_id] = (page, source)
+        elif role.endswith('-end'):
+            if element_id in open_starts:
+                close_pair(element_id, open_starts.pop(element_id), (page, source))
+            else:
+                open_ends[element_id] = (page, source)
+
+    issues = []
+    for element_id, count in record_counts.items():
+        if count != 2:
+            issues.append({'id': element_id, 'type': 'record_count', 'count': count})
+        elif element_id in open_starts:
+            issues.append({'id': element_id, 'type': 'missing_end'})
+        elif element_id in open_ends:
+            issues.append({'id': element_id, 'type': 'missing_start'})
+        else:
+            issues.extend(pair_issues.get(element_id, []))
+
+    # Spans only count for well-formed pairs, as before
+    spans = [span for span in spans if record_counts[span['id']] == 2]
+
+    return {
+        'file': str(ndjson_file),
+        'total_records': sum(page_source_stats.values()),
+        'elements': len(record_counts),
+        'page_sources': dict(page_source_stats),
+        'pages': {
+            str(page): dict(sources) for page, sources in sorted(
+                page_distribution.items(), key=lambda item: (isinstance(item[0], str), item[0]))
+        },
+        'spans': spans,
+        'issues': issues,
+        'warnings': warnings,
+    }
+
+def analyze_page_sources(ndjson_file):
+    """Analyze page number sources from NDJSON file"""
     
-    print(f"Total records analyzed: {len(records)}")
+    print(f"📊 Analyzing page sources in {ndjson_file}")
+    print("=" * 60)
+    
+    report = validate_file(ndjson_file)
+    for warning in report['warnings']:
+        print(f"⚠️  Warning: {warning}")
+    
+    print(f"Total records analyzed: {report['total_records']}")
     print()
     
+    total_records = report['total_records']
+    if not total_records:
+        return report
+    
     # Overall source statistics
     print("📈 Page Source Statistics:")
-    total_records = len(records)
+    page_source_stats = Counter(report['page_sources'])
     for source, count in page_source_stats.most_common():
         percentage = (count / total_records) * 100
         status = get_source_status(source)
@@ -58,21 +143,20 @@ def analyze_page_sources(ndjson_file):
     
     # Page-by-page breakdown
     print("\n📄 Page-by-Page Breakdown:")
-    for page in sorted(page_distribution.keys()):
+    for page, sources in report['pages'].items():
         if page == 'unknown':
             continue
-        sources = page_distribution[page]
         total_on_page = sum(sources.values())
-        print(f"  Page {page:2d}: {total_on_page:2d} elements")
+        print(f"  Page {int(page):2d}: {total_on_page:2d} elements")
         
         for source, count in sorted(sources.items()):
             status = get_source_status(source)
             print(f"    {status} {source:15} {count:2d}")
     
     # Identify problematic elements
-    identify_issues(records)
+    identify_issues(report)
     
-    return records
+    return report
 
 def get_source_status(source):
     """Get status emoji for page source"""
@@ -128,94 +212,260 @@ def assess_accuracy(page_source_stats, total_records):
         print("  • Consider using zref-savepos package")
         print("  • Add \\label{} commands for critical elements")
 
-def identify_issues(records):
-    """Identify specific problematic elements"""
+def identify_issues(report):
+    """Print the pairing and page-source issues found by validate_file"""
     
     print("\n🔍 Issue Detection:")
     
-    # Group by ID to find start/end pairs
-    grouped = defaultdict(list)
-    for record in records:
-        grouped[record['id']].append(record)
-    
-    issues_found = False
+    for span in report['spans']:
+        print(f"  📄 {span['id']}: Spans pages {span['start_page']}-{span['end_page']}")
     
-    for element_id, element_records in grouped.items():
-        if len(element_records) != 2:
-            print(f"  ⚠️  {element_id}: {len(element_records)} records (expected 2)")
-            issues_found = True
-            continue
-            
-        start_record = None
-        end_record = None
-        
-        for record in element_records:
-            if record['role'].endswith('-start'):
-                start_record = record
-            elif record['role'].endswith('-end'):
-                end_record = record
-        
-        if not start_record or not end_record:
+    for issue in report['issues']:
+        element_id = issue['id']
+        if issue['type'] == 'record_count':
+            print(f"  ⚠️  {element_id}: {issue['count']} records (expected 2)")
+        elif issue['type'] in ('missing_start', 'missing_end'):
             print(f"  ⚠️  {element_id}: Missing start or end record")
-            issues_found = True
-            continue
-        
-        # Check for page mismatches
-        if start_record['page'] != end_record['page']:
-            print(f"  📄 {element_id}: Spans pages {start_record['page']}-{end_record['page']}")
-        
-        # Check for problematic sources
-        start_source = start_record.get('page_source', 'unknown')
-        end_source = end_record.get('page_source', 'unknown')
-        
-        if start_source in ['counter', 'counter-fallback'] or end_source in ['counter', 'counter-fallback']:
-            print(f"  ⚠️  {element_id}: Uses page counter (page {start_record['page']})")
-            issues_found = True
+        elif issue['type'] == 'counter_source':
+            print(f"  ⚠️  {element_id}: Uses page counter (page {issue['page']})")
     
-    if not issues_found:
+    if not report['issues']:
         print("  ✅ No significant issues detected")
 
+def load_expected_pages(expected_pages_file):
+    """Load expected pages as {id: page} from a mapping or a list of {id, page} objects"""
+    with open(expected_pages_file, 'r') as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        return {str(key): int(value) for key, value in data.items()}
+    return {str(item['id']): int(item['page']) for item in data}
+
 def compare_with_pdf_pages(ndjson_file, expected_pages_file=None):
     """Compare page numbers with expected values (if available)"""
     
     if not expected_pages_file or not Path(expected_pages_file).exists():
         print("\n📋 PDF Comparison: (manual verification needed)")
         print("  Compare figure page numbers in JSON output with actual PDF pages")
-        return
+        return []
     
     print(f"\n📋 Comparing with {expected_pages_file}")
     
-    # This would load expected page numbers and compare
-    # Implementation depends on format of expected_pages_file
-    pass
+    expected = load_expected_pages(expected_pages_file)
+    mismatches = []
+    checked = set()
+    for _, record in iter_records(ndjson_file):
+        element_id = record.get('id')
+        if not record.get('role', '').endswith('-start') or element_id not in expected:
+            continue
+        checked.add(element_id)
+        if record.get('page') != expected[element_id]:
+            mismatches.append({'id': element_id, 'expected': expected[element_id], 'actual': record.get('page')})
+            print(f"  ❌ {element_id}: page {record.get('page')} (expected {expected[element_id]})")
+    
+    missing = sorted(set(expected) - checked)
+    for element_id in missing:
+        print(f"  ❓ {element_id}: not found in {ndjson_file}")
+    
+    if not mismatches and not missing:
+        print(f"  ✅ All {len(checked)} expected pages match")
+    return mismatches
+
+def validate_directory(directory, pattern="*-texpos.ndjson", workers=None):
+    """Validate every matching NDJSON file under a directory in parallel"""
+    files = sorted(Path(directory).rglob(pattern))
+    workers = min(workers or os.cpu_count() or 1, max(len(files), 1))
+    if workers == 1:
+        return [validate_file(path) for path in files]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(validate_file, files, chunksize=max(1, len(files) // (workers * 4))))
+
+def summarize_reports(reports):
+    """Corpus-level totals over per-file reports"""
+    sources = Counter()
+    issue_types = Counter()
+    for report in reports:
+        sources.update(report['page_sources'])
+        issue_types.update(issue['type'] for issue in report['issues'])
+    return {
+        'files': len(reports),
+        'total_records': sum(report['total_records'] for report in reports),
+        'page_sources': dict(sources),
+        'issues': dict(issue_types),
+        'files_with_issues': sum(1 for report in reports if report['issues']),
+    }
+
+def load_positions(ndjson_file):
+    """Map (id, role) to (page, xsp, ysp) for the hash join in diff mode"""
+    positions = {}
+    for _, record in iter_records(ndjson_file):
+        key = (record.get('id'), record.get('role'))
+        # Keep the first occurrence, like the converter does for duplicates
+        if key not in positions:
+            positions[key] = (record.get('page'), float(record.get('xsp', 0)), float(record.get('ysp', 0)))
+    return positions
+
+def diff_runs(old_file, new_file, threshold_pt=DEFAULT_DRIFT_THRESHOLD_PT):
+    """
+    Hash-join two runs of the same document on (id, role).
+
+    The old run is loaded into a dict and the new run is streamed against it.
+    Reports page changes, coordinate drift above threshold_pt, and elements
+    present in only one run.
+    """
+    old_positions = load_positions(old_file)
+    page_changes = []
+    drifts = []
+    added = []
+    seen = set()
+
+    for _, record in iter_records(new_file):
+        key = (record.get('id'), record.get('role'))
+        if key in seen:
+            continue
+        seen.add(key)
+        old = old_positions.get(key)
+        if old is None:
+            added.append({'id': key[0], 'role': key[1]})
+            continue
+
+        old_page, old_x, old_y = old
+        new_page = record.get('page')
+        if old_page != new_page:
+            page_changes.append({'id': key[0], 'role': key[1], 'old_page': old_page, 'new_page': new_page})
+            continue
+
+        dx = (float(record.get('xsp', 0)) - old_x) / 65536.0
+        dy = (float(record.get('ysp', 0)) - old_y) / 65536.0
+        if max(abs(dx), abs(dy)) > threshold_pt:
+            drifts.append({'id': key[0], 'role': key[1], 'page': new_page,
+                           'dx_pt': round(dx, 2), 'dy_pt': round(dy, 2)})
+
+    removed = [{'id': key[0], 'role': key[1]} for key in old_positions if key not in seen]
+
+    return {
+        'old_file': str(old_file),
+        'new_file': str(new_file),
+        'threshold_pt': threshold_pt,
+        'compared': len(seen) - len(added),
+        'page_changes': page_changes,
+        'drifts': drifts,
+        'added': added,
+        'removed': removed,
+        'regressed': bool(page_changes or drifts or added or removed),
+    }
+
+def _diff_job(args):
+    return diff_runs(*args)
+
+def diff_directories(old_dir, new_dir, pattern="*-texpos.ndjson",
+                     threshold_pt=DEFAULT_DRIFT_THRESHOLD_PT, workers=None):
+    """Diff every file of new_dir against the file with the same relative path in old_dir"""
+    old_dir, new_dir = Path(old_dir), Path(new_dir)
+    jobs = []
+    unmatched = []
+    for new_file in sorted(new_dir.rglob(pattern)):
+        old_file = old_dir / new_file.relative_to(new_dir)
+        if old_file.exists():
+            jobs.append((old_file, new_file, threshold_pt))
+        else:
+            unmatched.append(str(new_file))
+
+    workers = min(workers or os.cpu_count() or 1, max(len(jobs), 1))
+    if workers == 1:
+        diffs = [_diff_job(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            diffs = list(pool.map(_diff_job, jobs, chunksize=max(1, len(jobs) // (workers * 4))))
+    return diffs, unmatched
+
+def print_diff(diff):
+    """Print a one-file diff summary"""
+    status = "❌" if diff['regressed'] else "✅"
+    print(f"{status} {diff['new_file']}: {diff['compared']} compared, "
+          f"{len(diff['page_changes'])} page changes, {len(diff['drifts'])} drifts "
+          f"> {diff['threshold_pt']}pt, {len(diff['added'])} added, {len(diff['removed'])} removed")
+    for change in diff['page_changes']:
+        print(f"  📄 {change['id']} ({change['role']}): page {change['old_page']} → {change['new_page']}")
+    for drift in diff['drifts']:
+        print(f"  ↔️  {drift['id']} ({drift['role']}): dx={drift['dx_pt']}pt dy={drift['dy_pt']}pt")
+
+def write_json_report(report, output_file):
+    with open(output_file, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n📝 JSON report saved: {output_file}")
 
 def main():
-    if len(sys.argv) < 2:
-        print("Usage: python3 validate_page_numbers.py <texpos.ndjson> [expected_pages.json]")
-        print()
-        print("This tool analyzes page number accuracy in TeX coordinate output.")
-        print()
-        print("Examples:")
-        print("  python3 validate_page_numbers.py document-texpos.ndjson")
-        print("  python3 validate_page_numbers.py document-texpos.ndjson expected.json")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(
+        description="Analyze page number accuracy in TeX coordinate output.",
+        epilog="Examples:\n"
+               "  python3 validate_page_numbers.py document-texpos.ndjson\n"
+               "  python3 validate_page_numbers.py document-texpos.ndjson expected.json\n"
+               "  python3 validate_page_numbers.py build/ --json report.json\n"
+               "  python3 validate_page_numbers.py new-run/ --diff old-run/ --drift-threshold 1",
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("path", help="-texpos.ndjson file, or a directory of them")
+    parser.add_argument("expected_file", nargs="?", default=None,
+                        help="Expected pages JSON ({id: page} or [{id, page}])")
+    parser.add_argument("--json", dest="json_report", default=None,
+                        help="Write a machine-readable JSON report")
+    parser.add_argument("--diff", dest="baseline", default=None,
+                        help="Baseline run (file or directory) to diff against")
+    parser.add_argument("--drift-threshold", type=float, default=DEFAULT_DRIFT_THRESHOLD_PT,
+                        help=f"Coordinate drift in pt reported by --diff (default: {DEFAULT_DRIFT_THRESHOLD_PT})")
+    parser.add_argument("--pattern", default="*-texpos.ndjson",
+                        help="File pattern for directories (default: *-texpos.ndjson)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Parallel processes for directories (default: CPU count)")
     
-    ndjson_file = sys.argv[1]
-    expected_file = sys.argv[2] if len(sys.argv) > 2 else None
+    args = parser.parse_args()
+    path = Path(args.path)
     
-    if not Path(ndjson_file).exists():
-        print(f"❌ Error: {ndjson_file} not found")
+    if not path.exists():
+        print(f"❌ Error: {path} not found")
         sys.exit(1)
     
     try:
-        records = analyze_page_sources(ndjson_file)
-        compare_with_pdf_pages(ndjson_file, expected_file)
+        if args.baseline:
+            if path.is_dir():
+                diffs, unmatched = diff_directories(args.baseline, path, args.pattern,
+                                                    args.drift_threshold, args.workers)
+            else:
+                diffs, unmatched = [diff_runs(args.baseline, path, args.drift_threshold)], []
+            for diff in diffs:
+                print_diff(diff)
+            for new_file in unmatched:
+                print(f"❓ {new_file}: no baseline")
+            regressed = sum(1 for diff in diffs if diff['regressed'])
+            print(f"\n{'❌' if regressed else '✅'} {regressed}/{len(diffs)} files changed")
+            if args.json_report:
+                write_json_report({'diffs': diffs, 'unmatched': unmatched, 'regressed': regressed},
+                                  args.json_report)
+            sys.exit(1 if regressed else 0)
+        
+        if path.is_dir():
+            reports = validate_directory(path, args.pattern, args.workers)
+            summary = summarize_reports(reports)
+            for report in reports:
+                status = "⚠️ " if report['issues'] else "✅"
+                print(f"{status} {report['file']}: {report['total_records']} records, "
+                      f"{len(report['issues'])} issues, {len(report['spans'])} page spans")
+            print(f"\n✅ Analysis complete for {summary['total_records']} records "
+                  f"in {summary['files']} files ({summary['files_with_issues']} with issues)")
+            if args.json_report:
+                write_json_report({'summary': summary, 'files': reports}, args.json_report)
+            return
+        
+        report = analyze_page_sources(path)
+        report['page_mismatches'] = compare_with_pdf_pages(path, args.expected_file)
         
-        print(f"\n✅ Analysis complete for {len(records)} records")
+        print(f"\n✅ Analysis complete for {report['total_records']} records")
+        if args.json_report:
+            write_json_report(report, args.json_report)
         
     except Exception as e:
         print(f"❌ Error: {e}")
         sys.exit(1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()